@@ -0,0 +1 @@
+"""Benchmark suite (asv) of the root_simulator package."""
@@ -0,0 +1,77 @@
+"""Benchmarks of the parsing functions in the read_res_data module."""
+import os
+
+from .common import STG_FILES, cleanup_tmpdir, copy_to_tmpdir
+
+import read_res_data as rrd
+
+
+class ReadResData:
+    """Time and peak memory of reading the supersting files."""
+
+    params = list(STG_FILES)
+    param_names = ['stg_file']
+    timeout = 300
+
+    def setup(self, stg_file):
+        """Work on a copy of the supersting file."""
+        self.tmpdir = copy_to_tmpdir(STG_FILES[stg_file])
+        self.file = f'{stg_file}.stg'
+
+    def teardown(self, stg_file):
+        """Remove the copy of the supersting file."""
+        cleanup_tmpdir(self.tmpdir)
+
+    def time_supersting_processing(self, stg_file):
+        """Time the extraction of the resistivity values and electrodes positions."""
+        rrd.supersting_processing(self.file)
+
+    def time_standardized_bert(self, stg_file):
+        """Time the creation of the DataContainerERT."""
+        rrd.standardized_bert(self.file)
+
+    def peakmem_supersting_processing(self, stg_file):
+        """Peak memory of the extraction of the resistivity values and electrodes positions."""
+        rrd.supersting_processing(self.file)
+
+    def peakmem_standardized_bert(self, stg_file):
+        """Peak memory of the creation of the DataContainerERT."""
+        rrd.standardized_bert(self.file)
+
+
+class ReadLargeSurvey:
+    """Time and peak memory of reading synthetic supersting files of increasing size."""
+
+    params = [10_000, 100_000, 1_000_000]
+    param_names = ['n_records']
+    timeout = 1200
+
+    def setup_cache(self):
+        """Write the synthetic supersting files once, return their directory."""
+        import synthetic_stg as sstg
+
+        for n_records in self.params:
+            sstg.write_stg(f'synthetic_{n_records}.stg', n_electrodes=200, n_records=n_records,
+                           ip=True)
+        return os.getcwd()
+
+    def setup(self, cache_dir, n_records):
+        """Work on a copy of the synthetic supersting file."""
+        self.file = f'synthetic_{n_records}.stg'
+        self.tmpdir = copy_to_tmpdir(os.path.join(cache_dir, self.file))
+
+    def teardown(self, cache_dir, n_records):
+        """Remove the copy of the synthetic supersting file."""
+        cleanup_tmpdir(self.tmpdir)
+
+    def time_supersting_processing(self, cache_dir, n_records):
+        """Time the extraction of the resistivity values and electrodes positions."""
+        rrd.supersting_processing(self.file)
+
+    def time_standardized_bert(self, cache_dir, n_records):
+        """Time the creation of the DataContainerERT."""
+        rrd.standardized_bert(self.file)
+
+    def peakmem_standardized_bert(self, cache_dir, n_records):
+        """Peak memory of the creation of the DataContainerERT."""
+        rrd.standardized_bert(self.file)
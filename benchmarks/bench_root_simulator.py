@@ -0,0 +1,129 @@
+"""Benchmarks of the meshing, modelling, inversion and rendering in the root_simulator module."""
+from .common import (GEOMETRIES, RHOMAP, STG_FILES, cleanup_tmpdir, copy_to_tmpdir,
+                     synthetic_simulator)
+
+from root_simulator import RootSimulator, RootSimulator2
+
+
+class CreateMesh:
+    """Time and peak memory of RootSimulator.create_mesh at several mesh qualities."""
+
+    params = [list(GEOMETRIES), [30, 32, 34]]
+    param_names = ['geometry', 'mesh_quality']
+    # create_mesh adds the electrodes to the geometry, hence a fresh geometry per measurement.
+    number = 1
+    timeout = 300
+
+    def setup(self, geometry, mesh_quality):
+        """Create the geometry, the mesh is created in the benchmark."""
+        self.simulator = RootSimulator()
+        self.simulator.create_geom(*GEOMETRIES[geometry])
+
+    def time_create_mesh(self, geometry, mesh_quality):
+        """Time the creation of the electrode scheme and the mesh."""
+        self.simulator.create_mesh('dd', mesh_quality=mesh_quality)
+
+    def peakmem_create_mesh(self, geometry, mesh_quality):
+        """Peak memory of the creation of the electrode scheme and the mesh."""
+        self.simulator.create_mesh('dd', mesh_quality=mesh_quality)
+
+    def track_mesh_cells(self, geometry, mesh_quality):
+        """Number of cells of the created mesh."""
+        return self.simulator.create_mesh('dd', mesh_quality=mesh_quality).cellCount()
+
+    track_mesh_cells.unit = 'cells'
+
+
+class SyntheticModel:
+    """Time and peak memory of the forward model and the inversion of RootSimulator."""
+
+    params = [list(GEOMETRIES), ['dd', 'wa']]
+    param_names = ['geometry', 'scheme_name']
+    number = 1
+    repeat = 1
+    timeout = 1800
+
+    def setup(self, geometry, scheme_name):
+        """Create the simulator and run the stages preceding the benchmarked ones."""
+        self.tmpdir = copy_to_tmpdir()
+        self.simulator = synthetic_simulator(geometry, scheme_name)
+        self.simulator.plot_rhomap(RHOMAP)
+        self.simulator.forward_model(RHOMAP)
+
+    def teardown(self, geometry, scheme_name):
+        """Remove the figures created."""
+        cleanup_tmpdir(self.tmpdir)
+
+    def time_forward_model(self, geometry, scheme_name):
+        """Time the simulation of the apparent resistivity."""
+        self.simulator.forward_model(RHOMAP)
+
+    def peakmem_forward_model(self, geometry, scheme_name):
+        """Peak memory of the simulation of the apparent resistivity."""
+        self.simulator.forward_model(RHOMAP)
+
+    def time_inversion2d(self, geometry, scheme_name):
+        """Time the inversion on the unstructured mesh and the regular grid."""
+        self.simulator.inversion2d()
+
+    def peakmem_inversion2d(self, geometry, scheme_name):
+        """Peak memory of the inversion on the unstructured mesh and the regular grid."""
+        self.simulator.inversion2d()
+
+
+class Animation:
+    """Time and peak memory of the rendering of the three models of RootSimulator."""
+
+    params = [list(GEOMETRIES), ['dd', 'wa']]
+    param_names = ['geometry', 'scheme_name']
+    number = 1
+    repeat = 1
+    timeout = 1800
+
+    def setup(self, geometry, scheme_name):
+        """Run the forward model and the inversion needed by animate_simulation."""
+        self.tmpdir = copy_to_tmpdir()
+        self.simulator = synthetic_simulator(geometry, scheme_name)
+        self.simulator.plot_rhomap(RHOMAP)
+        self.simulator.forward_model(RHOMAP)
+        self.simulator.inversion2d()
+
+    def teardown(self, geometry, scheme_name):
+        """Remove the figures created."""
+        cleanup_tmpdir(self.tmpdir)
+
+    def time_animate_simulation(self, geometry, scheme_name):
+        """Time the rendering of the three models and the animation."""
+        self.simulator.animate_simulation()
+
+    def peakmem_animate_simulation(self, geometry, scheme_name):
+        """Peak memory of the rendering of the three models and the animation."""
+        self.simulator.animate_simulation()
+
+
+class FieldData:
+    """Time and peak memory of the inverse simulation of the supersting files."""
+
+    params = list(STG_FILES)
+    param_names = ['stg_file']
+    number = 1
+    repeat = 1
+    timeout = 3600
+
+    def setup(self, stg_file):
+        """Create the inversion mesh of the supersting file."""
+        self.tmpdir = copy_to_tmpdir(STG_FILES[stg_file])
+        self.simulator = RootSimulator2(f'{stg_file}.stg')
+        self.simulator.generate_mesh()
+
+    def teardown(self, stg_file):
+        """Remove the copy of the supersting file."""
+        cleanup_tmpdir(self.tmpdir)
+
+    def time_inverse_simulation(self, stg_file):
+        """Time the inversion of the field data."""
+        self.simulator.inverse_simulation()
+
+    def peakmem_inverse_simulation(self, stg_file):
+        """Peak memory of the inversion of the field data."""
+        self.simulator.inverse_simulation()
@@ -0,0 +1,31 @@
+"""Benchmarks of the ElectrodeScheme class in the sensitivity_build module."""
+from .common import STG_FILES, cleanup_tmpdir, copy_to_tmpdir
+
+import read_res_data as rrd
+import sensitivity_build as sb
+
+
+class ExtractElectrode:
+    """Time and peak memory of ElectrodeScheme.extract_electrode on the processed (.dat) files."""
+
+    params = list(STG_FILES)
+    param_names = ['stg_file']
+    timeout = 300
+
+    def setup(self, stg_file):
+        """Process the supersting file into the .dat file read by the ElectrodeScheme."""
+        self.tmpdir = copy_to_tmpdir(STG_FILES[stg_file])
+        rrd.standardized_bert(f'{stg_file}.stg', save_file=True)
+        self.scheme = sb.ElectrodeScheme(f'{stg_file}.dat')
+
+    def teardown(self, stg_file):
+        """Remove the processed files."""
+        cleanup_tmpdir(self.tmpdir)
+
+    def time_extract_electrode(self, stg_file):
+        """Time the extraction of the electrode configuration."""
+        self.scheme.extract_electrode()
+
+    def peakmem_extract_electrode(self, stg_file):
+        """Peak memory of the extraction of the electrode configuration."""
+        self.scheme.extract_electrode()
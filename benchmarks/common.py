@@ -0,0 +1,72 @@
+"""Shared fixtures of the benchmark suite.
+
+The fixtures are built from the supersting files shipped with the repository
+(tests/test_data.stg and the example MSU files) and from synthetic geometries of the
+subsurface created with the RootSimulator class.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import matplotlib
+
+matplotlib.use('Agg')  # the benchmarks do not need a display
+
+# Get the location of the modules
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(REPO_DIR, 'root_simulator'))
+
+# The supersting files available for the benchmarks
+STG_FILES = {
+    'test_data': os.path.join(REPO_DIR, 'tests', 'test_data.stg'),
+    'MSU130SH': os.path.join(REPO_DIR, 'example', 'simulate_root_models', 'MSU130SH.stg'),
+    'MSU157SH': os.path.join(REPO_DIR, 'example', 'simulate_root_models', 'MSU157SH.stg'),
+}
+
+# Synthetic geometries: [x_ext, y_ext, layer, feature] as expected by RootSimulator.create_geom
+GEOMETRIES = {
+    'triangle': [[50, -50], -50, [-1, -20], [(-10, -1), (17, -8), (5, -1)]],
+    'tree': [[50, -50], -50, [-1, -20],
+             [(-10, -1), (-10, -2.5), (-19, -10), (-22, -17), (-17.7, -11.2), (-12, -7),
+              (-13.7, -10), (-16, -12), (-18, -18), (-15, -15), (-10, -12), (-9, -17),
+              (-7, -12), (-7, -7), (-5, -12), (-3, -17), (-1, -12), (0, -9), (8, -17),
+              (2, -10), (10, -12), (12, -15), (15, -17), (12, -10), (5, -8), (9.3, -6),
+              (17, -8), (25, -14), (16, -6), (5, -3), (5, -1)]],
+}
+
+# Resistivity map of the regions created by the geometries above
+RHOMAP = [[1, 100], [2, 75], [3, 50], [4, 150]]
+
+
+def copy_to_tmpdir(*files):
+    """Copy the files into a new temporary directory and change into it.
+
+    Several functions of the package save their output next to the input file or in the
+    current directory, hence the benchmarks are executed in a disposable directory.
+    Returns the temporary directory, it should be passed to cleanup_tmpdir in the teardown.
+    """
+    tmpdir = tempfile.mkdtemp(prefix='root_simulator_bench_')
+    for file in files:
+        shutil.copy(file, tmpdir)
+    os.chdir(tmpdir)
+    return tmpdir
+
+
+def cleanup_tmpdir(tmpdir):
+    """Leave and remove the temporary directory created by copy_to_tmpdir."""
+    import matplotlib.pyplot as plt
+
+    plt.close('all')
+    os.chdir(REPO_DIR)
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def synthetic_simulator(geometry='triangle', scheme_name='dd', mesh_quality=34):
+    """Return a RootSimulator with the given synthetic geometry and electrode scheme."""
+    from root_simulator import RootSimulator
+
+    simulator = RootSimulator()
+    simulator.create_geom(*GEOMETRIES[geometry])
+    simulator.create_mesh(scheme_name, mesh_quality=mesh_quality)
+    return simulator
@@ -0,0 +1,139 @@
+"""The data_qc module cleans the resistivity data before the inversion.
+
+The measurements using the same two dipoles, i.e. the repeated (stacked) readings of an
+ABMN configuration and its reciprocal MNAB configuration, are indexed by a key built from the
+sorted electrodes of each dipole. The relative standard deviation of the apparent resistivity
+within each group (reciprocal error) is used to reject the outliers and to fit an error model
+(absolute + relative error) for the inversion. Optionally, each group is reduced to one
+averaged reading, which shortens the inversion as its cost grows with the number of data.
+
+All the operations are vectorized on the arrays of the DataContainerERT.
+
+Dependence: numpy
+"""
+import numpy as np
+
+
+def dipole_keys(a_ind, b_ind, m_ind, n_ind):
+    """Return the key of the configuration and the key of its reciprocal for each reading.
+
+    The key of a dipole is built from its sorted electrodes, so ABMN, BAMN, ABNM... share the
+    key of the configuration, and MNAB... share the key of the reciprocal.
+    """
+    a_ind, b_ind, m_ind, n_ind = (np.asarray(ind, dtype=np.int64) + 1  # pole electrodes: -1
+                                  for ind in (a_ind, b_ind, m_ind, n_ind))
+    base = int(max(a_ind.max(), b_ind.max(), m_ind.max(), n_ind.max())) + 1
+    current = np.minimum(a_ind, b_ind) * base + np.maximum(a_ind, b_ind)
+    potential = np.minimum(m_ind, n_ind) * base + np.maximum(m_ind, n_ind)
+    return current * base ** 2 + potential, potential * base ** 2 + current
+
+
+def group_readings(a_ind, b_ind, m_ind, n_ind):
+    """Return the group of each reading, the readings of a group share the same two dipoles.
+
+    A normal and a reciprocal configuration (and their repetitions) belong to the same group.
+    """
+    normal, reciprocal = dipole_keys(a_ind, b_ind, m_ind, n_ind)
+    _, groups = np.unique(np.minimum(normal, reciprocal), return_inverse=True)
+    return groups.ravel()
+
+
+def reciprocal_error(values, groups):
+    """Return the mean and the relative spread (standard deviation / mean) of each group.
+
+    The standard deviation is the sample one (n - 1), so it estimates the error of one
+    reading, and is 0 for the groups of one reading. The arrays are of the size of the number
+    of groups, together with the size of each group.
+    """
+    values = np.abs(np.asarray(values, dtype=float))
+    counts = np.bincount(groups)
+    mean = np.bincount(groups, weights=values) / counts
+    squares = np.bincount(groups, weights=(values - mean[groups]) ** 2)
+    spread = np.sqrt(squares / np.maximum(counts - 1, 1))
+    # the spread of the groups without a valid value is not defined
+    return mean, spread / np.where(mean > 0, mean, np.nan), counts
+
+
+def fit_error_model(mean, spread, n_bins=20):
+    """Fit the error model: absolute error = a + b * value, from the reciprocal spreads.
+
+    The values are binned logarithmically, the root mean square of the absolute spread of each
+    bin is fitted by least squares. Returns (a, b), the absolute and relative errors.
+    """
+    mean = np.asarray(mean, dtype=float)
+    abs_spread = np.asarray(spread, dtype=float) * mean
+    edges = np.logspace(np.log10(mean.min()), np.log10(mean.max()), n_bins + 1)
+    bins = np.clip(np.searchsorted(edges, mean, side='right') - 1, 0, n_bins - 1)
+    counts = np.bincount(bins, minlength=n_bins)
+    filled = counts > 0
+    rms = np.sqrt(np.bincount(bins, weights=abs_spread ** 2, minlength=n_bins)[filled]
+                  / counts[filled])
+    center = (np.bincount(bins, weights=mean, minlength=n_bins)[filled] / counts[filled])
+
+    if filled.sum() < 2:
+        return 0.0, float(np.median(spread))
+    absolute, relative = np.linalg.lstsq(np.vstack((np.ones_like(center), center)).T, rms,
+                                         rcond=None)[0]
+    return max(float(absolute), 0.0), max(float(relative), 0.0)
+
+
+def quality_control(data, max_error=0.1, decimate=False, relative_error=0.02, min_pairs=10):
+    """Remove the outliers, set the error of the data and optionally decimate them.
+
+    Parameters
+    ----------
+    data: DataContainerERT (e.g. the output of standardized_bert), modified in place.
+    max_error: the readings of the groups (normal/reciprocal or stacked readings) whose
+               relative spread (standard deviation / mean) exceeds max_error are removed.
+    decimate: boolean. To keep one reading per group, with the mean apparent resistivity.
+    relative_error: the relative error used if fewer than min_pairs groups are repeated.
+    min_pairs: the minimum number of repeated groups needed to fit the error model.
+
+    return
+    ------
+    A dictionary reporting the data reduction and the error model.
+    """
+    rhoa = np.array(data['rhoa'])
+    n_data = len(rhoa)
+    invalid = ~(rhoa > 0)
+
+    # the groups are formed with the valid readings only
+    valid = np.nonzero(~invalid)[0]
+    _, groups = np.unique(group_readings(data['a'], data['b'], data['m'], data['n'])[valid],
+                          return_inverse=True)
+    groups = groups.ravel()
+    mean, spread, counts = reciprocal_error(rhoa[valid], groups)
+    repeated = counts > 1
+    outlier = repeated & (spread > max_error)
+    remove = invalid.copy()
+    remove[valid[outlier[groups]]] = True
+
+    # the error model is fitted on the repeated groups without outliers
+    fitted = repeated & ~outlier
+    if fitted.sum() >= min_pairs:
+        absolute, relative = fit_error_model(mean[fitted], spread[fitted])
+    else:
+        absolute, relative = 0.0, relative_error
+
+    n_decimated = 0
+    if decimate:
+        # keep the first reading of each group, with the mean of the group
+        _, first = np.unique(groups, return_index=True)
+        keep = np.zeros(n_data, dtype=bool)
+        keep[valid[first]] = True
+        rhoa[valid[first]] = mean
+        data.set('rhoa', rhoa)
+        n_decimated = int((~keep & ~remove).sum())
+        remove = remove | ~keep
+
+    data.set('err', absolute / np.maximum(np.abs(rhoa), 1e-12) + relative)
+    data.remove(remove)
+
+    report = {'data': n_data, 'invalid': int(invalid.sum()),
+              'repeated_groups': int(repeated.sum()), 'outlier_groups': int(outlier.sum()),
+              'outliers': int(outlier[groups].sum()), 'decimated': n_decimated,
+              'remaining': n_data - int(remove.sum()), 'absolute_error': absolute,
+              'relative_error': relative}
+    # The Jacobian and the inversion system grow linearly with the number of data.
+    report['reduction'] = 1 - report['remaining'] / n_data
+    return report
@@ -0,0 +1,221 @@
+"""The instrumentation module records the time and memory spent in each stage of a simulation.
+
+The public functions and methods of the root_simulator package, and their internal stages
+(parsing, meshing, Jacobian computation, inversion iterations...), are wrapped in spans. When
+the instrumentation is enabled, every span emits an event containing the wall and CPU time,
+the peak resident memory (RSS) of the process and the information attached to the span,
+e.g. the number of nodes and cells of a mesh, the number of data or the chi² of an iteration.
+The events are passed to a callback function and/or written as JSON lines into a file.
+
+When disabled (the default), a span is a shared object that does nothing, hence the
+instrumentation costs a function call per stage.
+
+Dependence: json, time, resource (unix only)
+
+Example
+-------
+    import instrumentation as ins
+
+    ins.enable(path='run_profile.jsonl')  # or ins.enable(callback=print)
+    simulate_data = RootSimulator2('MSU130SH.stg')
+    simulate_data.generate_mesh()
+    simulate_data.inverse_simulation()
+    ins.disable()
+"""
+import functools
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # resource is not available on windows
+    resource = None
+
+# The callbacks receiving the events, the instrumentation is disabled while it is empty.
+_SINKS = []
+# Keeps the stack of the open spans for each thread, used to nest the spans.
+_LOCAL = threading.local()
+
+
+def peak_rss_mb():
+    """Return the peak resident memory of the process in MB (None if not available)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on linux but in bytes on mac
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _json_line(file):
+    """Return a sink appending the events as JSON lines to the given file path."""
+    def write(event):
+        with open(file, 'a', encoding='utf-8') as files:
+            files.write(json.dumps(event, default=str) + '\n')
+    return write
+
+
+def enable(callback=None, path=None):
+    """Enable the instrumentation.
+
+    Parameters
+    ----------
+    callback: function called with each event (a dictionary).
+    path: file in which the events are appended as JSON lines.
+
+    If neither is given, the events are printed as JSON lines.
+    """
+    if callback is None and path is None:
+        callback = lambda event: print(json.dumps(event, default=str))  # noqa: E731
+    if callback is not None:
+        _SINKS.append(callback)
+    if path is not None:
+        _SINKS.append(_json_line(path))
+
+
+def disable():
+    """Disable the instrumentation and remove all the callbacks."""
+    _SINKS.clear()
+
+
+def is_enabled():
+    """Return True if the instrumentation is enabled."""
+    return bool(_SINKS)
+
+
+def _emit(event):
+    """Pass the event to all the sinks."""
+    for sink in list(_SINKS):
+        sink(event)
+
+
+def _stack():
+    """Return the stack of the open spans of the current thread."""
+    if not hasattr(_LOCAL, 'stack'):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+class Span:
+    """Measure the wall time, CPU time and peak memory of a stage.
+
+    The span is used as a context manager, and the information about the stage can be added
+    while it is open using the set function.
+    """
+
+    def __init__(self, name, **info):
+        """Initialize the name of the stage and the information attached to it."""
+        self.name = name
+        self.info = info
+        self.parent = None
+        self.__wall = 0
+        self.__cpu = 0
+
+    def set(self, **info):
+        """Attach information (mesh size, data count...) to the span."""
+        self.info.update(info)
+
+    def __enter__(self):
+        """Start the clocks."""
+        stack = _stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.__wall = time.perf_counter()
+        self.__cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop the clocks and emit the event."""
+        wall = time.perf_counter() - self.__wall
+        cpu = time.process_time() - self.__cpu
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        event = {'event': 'span', 'name': self.name, 'parent': self.parent,
+                 'depth': len(stack), 'time': time.time(), 'wall': wall, 'cpu': cpu,
+                 'peak_rss_mb': peak_rss_mb(), 'failed': exc_type is not None}
+        event.update(self.info)
+        _emit(event)
+        return False
+
+
+class _NullSpan:
+    """Span used when the instrumentation is disabled, it does nothing."""
+
+    def set(self, **info):
+        """Ignore the information."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **info):
+    """Return a context manager measuring the stage 'name'.
+
+    Example-- with span('createParaMesh', sensors=84) as stage:
+                  mesh = mt.createParaMesh(...)
+                  stage.set(nodes=mesh.nodeCount(), cells=mesh.cellCount())
+    """
+    if not _SINKS:
+        return _NULL_SPAN
+    return Span(name, **info)
+
+
+def record(name, **info):
+    """Emit a single event (e.g. the chi² of an inversion iteration) inside the open span."""
+    if not _SINKS:
+        return
+    stack = _stack()
+    event = {'event': 'record', 'name': name, 'parent': stack[-1].name if stack else None,
+             'depth': len(stack), 'time': time.time()}
+    event.update(info)
+    _emit(event)
+
+
+def record_iterations(inversion):
+    """Emit the chi² of each iteration of a finished pygimli inversion."""
+    if not _SINKS:
+        return
+    for iteration, chi2 in enumerate(getattr(inversion, 'chi2History', []) or [], start=1):
+        record('iteration', iteration=iteration, chi2=float(chi2))
+
+
+def watch_iterations(inversion):
+    """Emit a 'progress' event with the chi² at the end of each iteration of a pygimli inversion.
+
+    Unlike record_iterations, the events are emitted while the inversion runs (e.g. to stream
+    the progress of a job). Nothing is done if the instrumentation is disabled.
+    """
+    if not _SINKS or not hasattr(inversion, 'setPostStep'):
+        return
+
+    def post_step(iteration, inv):
+        record('progress', iteration=int(iteration), chi2=float(inv.chi2()))
+    inversion.setPostStep(post_step)
+
+
+def mesh_info(mesh):
+    """Return the number of nodes and cells of a pygimli mesh."""
+    return {'nodes': mesh.nodeCount(), 'cells': mesh.cellCount()}
+
+
+def instrumented(name=None):
+    """Decorate a function so each call is wrapped in a span (named after the function)."""
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _SINKS:
+                return func(*args, **kwargs)
+            with Span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,164 @@
+"""The ip_processing module processes the induced polarization (IP) decays of all the readings.
+
+The six IP windows of all the readings are processed at once: each decay is fitted by an
+exponential m(t) = m0 exp(-t / tau) (linear least squares on the logarithm of the windows,
+solved in closed form for the whole array), the decays that do not decrease or are poorly
+fitted are rejected, and the integral chargeability is recomputed from the fitted decays.
+
+The chargeability is then imaged with the linearized IP inversion (Oldenburg & Li, 1994): the
+apparent chargeability is the product of the normalized sensitivities of the resistivity
+inversion, J_ij rho_j / rhoa_i, with the chargeability of the cells. The mesh and the Jacobian
+of the resistivity inversion are reused, so the chargeability inversion only solves one
+regularized least squares problem (CGLS) without any forward computation.
+
+Dependence: numpy
+"""
+import numpy as np
+
+N_WINDOWS = 6
+
+# delay and length of the IP windows (s) of the supersting files, see synthetic_stg
+IP_DELAY, IP_WINDOW = 0.26, 0.1
+
+
+def window_gates(delay=IP_DELAY, window=IP_WINDOW, n_windows=N_WINDOWS):
+    """Return the time (s) at the center of each IP window."""
+    return delay + window * (np.arange(n_windows) + 0.5)
+
+
+def fit_decays(windows, gates):
+    """Fit an exponential decay to each row of windows.
+
+    Parameters
+    ----------
+    windows: array (readings, windows) of the chargeability of each window.
+    gates: the time at the center of each window.
+
+    return
+    ------
+    m0, tau and the misfit (root mean square of the residuals of log(m)) of each decay. The
+    decays with a non-positive window have NaN values, the rising decays a negative tau.
+    """
+    windows = np.asarray(windows, dtype=float)
+    gates = np.asarray(gates, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_win = np.log(np.where(windows > 0, windows, np.nan))
+        centered = gates - gates.mean()
+        mean_log = log_win.mean(axis=1)
+        slope = (log_win - mean_log[:, None]) @ centered / (centered @ centered)
+        intercept = mean_log - slope * gates.mean()
+        residual = log_win - (intercept[:, None] + slope[:, None] * gates[None, :])
+        misfit = np.sqrt(np.mean(residual ** 2, axis=1))
+        tau = -1 / slope
+    return np.exp(intercept), tau, misfit
+
+
+def integral_chargeability(m0, tau, start, end):
+    """Return the integral of the decays m0 exp(-t / tau) from start to end (s)."""
+    return m0 * tau * (np.exp(-start / tau) - np.exp(-end / tau))
+
+
+def process_ip(data, delay=IP_DELAY, window=IP_WINDOW, max_misfit=0.1):
+    """Fit the IP decays, reject the bad ones and recompute the integral chargeability.
+
+    Parameters
+    ----------
+    data: DataContainerERT with the 'ip1' to 'ip6' windows (see standardized_bert). The 'ip'
+          (integral chargeability in msec) of the valid decays is replaced by the integral of
+          the fitted decay over the windows, and their time constant is set in 'tau'.
+    delay: the delay (s) between the current shut-off and the first window.
+    window: the length (s) of each window.
+    max_misfit: the decays whose misfit (rms of the log residuals) exceeds max_misfit are
+                rejected.
+
+    return
+    ------
+    The boolean array of the valid decays and a dictionary reporting the processing.
+    """
+    if not data.haveData('ip1'):
+        raise ValueError("The data have no IP windows, read an IP supersting file")
+    windows = np.column_stack([np.array(data[f'ip{i + 1}']) for i in range(N_WINDOWS)])
+    m0, tau, misfit = fit_decays(windows, window_gates(delay, window))
+
+    # a decay must be positive, decreasing and well fitted
+    valid = np.isfinite(misfit) & (tau > 0) & (misfit <= max_misfit)
+    charge = np.array(data['ip'])
+    charge[valid] = 1000 * integral_chargeability(m0[valid], tau[valid], delay,
+                                                  delay + N_WINDOWS * window)
+    data.set('ip', charge)
+    data.set('tau', np.where(valid, tau, 0.0))
+
+    report = {'data': len(valid), 'rejected': int((~valid).sum()),
+              'median_tau': float(np.median(tau[valid])) if valid.any() else None,
+              'median_misfit': float(np.median(misfit[valid])) if valid.any() else None}
+    return valid, report
+
+
+def sensitivity(jacobian, model, response):
+    """Return the normalized sensitivity J_ij rho_j / rhoa_i of the apparent chargeability."""
+    return np.asarray(jacobian) * np.asarray(model)[None, :] / np.asarray(response)[:, None]
+
+
+def _cgls(matvec, rmatvec, rhs, n_para, max_iter=200, tol=1e-6):
+    """Solve the least squares problem min |A x - rhs| by conjugate gradients (CGLS)."""
+    x_val = np.zeros(n_para)
+    residual = rhs.copy()
+    s_val = rmatvec(residual)
+    p_val = s_val.copy()
+    gamma = s_val @ s_val
+    if gamma == 0:
+        return x_val
+    stop = tol ** 2 * gamma
+    for _ in range(max_iter):
+        q_val = matvec(p_val)
+        alpha = gamma / (q_val @ q_val)
+        x_val += alpha * p_val
+        residual -= alpha * q_val
+        s_val = rmatvec(residual)
+        gamma, gamma_old = s_val @ s_val, gamma
+        if gamma <= stop:
+            break
+        p_val = s_val + gamma / gamma_old * p_val
+    return x_val
+
+
+def invert_chargeability(sens, charge, error, constraints, lam=20, valid=None, max_iter=200):
+    """Invert the apparent chargeability with the sensitivity of the resistivity inversion.
+
+    Parameters
+    ----------
+    sens: the normalized sensitivity (data, cells), see sensitivity.
+    charge: the apparent chargeability of the data.
+    error: the absolute error of the apparent chargeability.
+    constraints: the smoothness constraints (rows, cols, values) of the cells, e.g. the
+                 constraint matrix of the resistivity inversion.
+    lam: the regularization strength.
+    valid: boolean array of the data to invert (e.g. the valid decays of process_ip).
+    max_iter: the maximum number of CGLS iterations.
+
+    return
+    ------
+    The chargeability of the cells (non-negative) and the simulated apparent chargeability.
+    """
+    sens = np.asarray(sens, dtype=float)
+    n_data, n_para = sens.shape
+    valid = np.ones(n_data, dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+    weight = np.where(valid, 1 / np.asarray(error, dtype=float), 0.0)
+    weighted = sens * weight[:, None]
+    rows, cols, vals = (np.asarray(arr) for arr in constraints)
+    rows, cols = rows.astype(np.int64), cols.astype(np.int64)
+    n_constraints = int(rows.max()) + 1 if len(rows) else 0
+    sqrt_lam = np.sqrt(lam)
+
+    def matvec(vec):
+        smooth = np.bincount(rows, weights=vals * vec[cols], minlength=n_constraints)
+        return np.concatenate((weighted @ vec, sqrt_lam * smooth))
+
+    def rmatvec(vec):
+        smooth = np.bincount(cols, weights=vals * vec[n_data:][rows], minlength=n_para)
+        return weighted.T @ vec[:n_data] + sqrt_lam * smooth
+
+    rhs = np.concatenate((np.where(valid, np.asarray(charge, dtype=float), 0.0) * weight,
+                          np.zeros(n_constraints)))
+    model = np.maximum(_cgls(matvec, rmatvec, rhs, n_para, max_iter=max_iter), 0.0)
+    return model, sens @ model
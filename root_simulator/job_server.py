@@ -0,0 +1,564 @@
+"""The job_server module shares a computer between the simulations of several users.
+
+A local HTTP server accepts jobs using the package: 'ingest' (read and clean supersting files),
+'forward' (synthetic data of a RootSimulator geometry), 'inversion' (RootSimulator2) and
+'sweep' (inversion with the lambda selected on the L-curve). The jobs are queued by priority
+and run on a bounded pool of worker processes, one process per job, so the users no longer
+compete for the cores. A queued or running job can be cancelled.
+
+The workers enable the instrumentation module: the spans and the chi² of each inversion
+iteration are streamed to the clients as JSON lines while the job runs.
+
+A job is identified by the sha256 of its type, parameters and the content of its input files.
+Submitting a job identical to a queued, running or finished job returns that job, and the
+results of the finished jobs are cached on disk, so repeated requests are served without
+recomputing, even after a restart of the server.
+
+Endpoints
+---------
+    POST   /jobs               submit a job (JSON), returns its job_id
+    GET    /jobs               list the jobs
+    GET    /jobs/<id>          status and result of a job
+    GET    /jobs/<id>/events   stream the events of a job (JSON lines) until it ends
+    DELETE /jobs/<id>          cancel a job
+
+Dependence: http.server, multiprocessing, json (the jobs use the root_simulator modules)
+
+Example
+-------
+    python job_server.py --port 8765 --workers 2
+
+    job = submit('http://localhost:8765', {'type': 'inversion',
+                                          'files': [os.path.abspath('MSU130SH.stg')],
+                                          'params': {'lam': 20}, 'priority': 1})
+    for event in stream('http://localhost:8765', job['job_id']):
+        print(event)
+"""
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+JOB_TYPES = ['ingest', 'forward', 'inversion', 'sweep']
+# the status of the jobs that will not change anymore
+FINISHED = ['done', 'failed', 'cancelled']
+
+
+def job_key(kind, files, params):
+    """Return the sha256 identifying a job from its type, parameters and input files content."""
+    from results_store import file_digest
+
+    digest = hashlib.sha256(json.dumps({'type': kind, 'params': params}, sort_keys=True,
+                                       default=str).encode('utf-8'))
+    for file in files:
+        digest.update(file_digest(file).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _read_data(files, params):
+    """Return the DataContainerERT of the files, cleaned if quality_control is in params.
+
+    The 'offsets' of params are the x-offsets of the files of a roll-along survey, see
+    merge_surveys.
+    """
+    import read_res_data as rrd
+    import data_qc as dqc
+
+    data = rrd.standardized_bert(files[0]) if len(files) == 1 else rrd.merge_surveys(
+        files, offsets=params.get('offsets'))
+    report = None
+    if params.get('quality_control') is not None:
+        report = dqc.quality_control(data, **params['quality_control'])
+    return data, report
+
+
+def _ingest(job_id, files, params, directory):
+    """Read (and clean) the supersting files and save the data in the .dat format."""
+    data, report = _read_data(files, params)
+    data_file = os.path.join(directory, f'{job_id}.dat')
+    data.save(data_file)
+    return {'data_file': data_file, 'sensors': data.sensorCount(), 'data': data.size(),
+            'qc_report': report}
+
+
+def _forward(job_id, files, params, directory):
+    """Simulate the synthetic data of a geometry (see RootSimulator) and save them."""
+    from pygimli.physics import ert
+    import instrumentation as ins
+    from root_simulator import RootSimulator
+
+    simulator = RootSimulator()
+    simulator.create_geom(*params['geometry'])
+    simulator.create_mesh(**params.get('scheme', {'scheme_name': 'dd'}))
+    with ins.span('simulate', **ins.mesh_info(simulator.mesh)):
+        data = ert.simulate(simulator.mesh, scheme=simulator.scheme, res=params['rhomap'],
+                            noiseLevel=params.get('noise_level', 1), noiseAbs=1e-6, seed=1337)
+        data.remove(data['rhoa'] < 0)
+    data_file = os.path.join(directory, f'{job_id}.dat')
+    data.save(data_file)
+    return {'data_file': data_file, 'data': data.size(), **ins.mesh_info(simulator.mesh)}
+
+
+def _inversion(job_id, files, params, directory):
+    """Invert the supersting files with RootSimulator2, the result is saved in a ResultsStore."""
+    import results_store as rs
+    from root_simulator import RootSimulator2
+
+    simulator = RootSimulator2(files[0] if len(files) == 1 else files,
+                               offsets=params.get('offsets'))
+    if params.get('quality_control') is not None:
+        simulator.quality_control(**params['quality_control'])
+    simulator.generate_mesh(**params.get('mesh', {}))
+    store = rs.ResultsStore(os.path.join(directory, 'results'))
+    # the job already holds a worker, the lambda selection runs in it unless
+    # lambda_workers allows more processes
+    simulator.inverse_simulation(store=store, lam=params.get('lam', 20),
+                                 criterion=params.get('criterion', 'lcurve'),
+                                 lambda_workers=params.get('lambda_workers', 1))
+    result = {'run_id': simulator.run_id, 'store': os.path.abspath(store.directory),
+              'chi2': store.load(simulator.run_id).chi2}
+    if params.get('lam') == 'auto':
+        result['lambda_curve'] = {key: simulator.lambda_curve[key].tolist()
+                                  for key in ['lambdas', 'chi2', 'phi_d', 'phi_m']}
+        result['lam'] = simulator.lambda_curve['lam']
+    return result
+
+
+def _sweep(job_id, files, params, directory):
+    """Invert the supersting files with the lambda selected by select_lambda."""
+    return _inversion(job_id, files, dict(params, lam='auto'), directory)
+
+
+_RUNNERS = {'ingest': _ingest, 'forward': _forward, 'inversion': _inversion, 'sweep': _sweep}
+
+
+def _run_job(job_id, kind, files, params, directory, events, threads=None):
+    """Run a job in a worker process, its events are sent through the events connection."""
+    if threads:
+        # must be set before pygimli is imported by the job
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+    import matplotlib
+
+    matplotlib.use('Agg')  # the figures of the package are not displayed
+    import instrumentation as ins
+
+    ins.enable(callback=events.send)
+    try:
+        result = _RUNNERS[kind](job_id, files, params, directory)
+        events.send({'event': 'done', 'time': time.time(), 'result': result})
+    except Exception as error:  # pylint: disable=broad-except
+        # the error is reported to the client instead of killing the worker silently
+        events.send({'event': 'error', 'time': time.time(), 'error': repr(error)})
+    events.close()
+
+
+class JobServer:
+    """Queue the jobs by priority and run them on a bounded pool of worker processes.
+
+    Parameters
+    ----------
+    directory: the directory of the outputs (data files, ResultsStore) and of the cache.
+    workers: the maximum number of jobs running at the same time.
+    threads: the number of threads of each job (OMP_NUM_THREADS). Default is not limited.
+
+    Functions
+    ---------
+    start, stop: start and stop the scheduling of the jobs.
+    submit: queues a job, or returns the identical job already submitted or cached.
+    cancel: cancels a queued or running job.
+    status: returns the status and result of a job.
+    wait_events: returns the new events of a job.
+    """
+
+    def __init__(self, directory='jobs', workers=2, threads=None):
+        """Create the directories of the outputs and of the cache."""
+        if workers < 1:
+            raise ValueError("At least one worker is needed")
+        self.directory = os.path.abspath(directory)
+        self.workers = workers
+        self.threads = threads
+        self.jobs = {}
+        os.makedirs(os.path.join(self.directory, 'cache'), exist_ok=True)
+        self.__keys = {}  # the job_id of each job key
+        self.__queue = []  # heap of (-priority, order, job_id)
+        self.__order = itertools.count()
+        self.__running = {}  # the worker process of each running job
+        # the pipe of each worker, one per job so a cancelled (terminated) worker cannot
+        # corrupt the events of the others. It is closed when the worker exits.
+        self.__pipes = {}
+        self.__lock = threading.Condition()
+        self.__context = mp.get_context('spawn')  # the workers start without inherited state
+        self.__stop = threading.Event()
+        self.__threads = []
+
+    def start(self):
+        """Start the scheduling of the jobs and the collection of their events."""
+        self.__stop.clear()
+        self.__threads = [threading.Thread(target=target, daemon=True)
+                          for target in (self.__schedule, self.__collect)]
+        for thread in self.__threads:
+            thread.start()
+
+    def stop(self):
+        """Stop the scheduling and terminate the running jobs."""
+        self.__stop.set()
+        with self.__lock:
+            processes = list(self.__running.values())
+            for job_id in list(self.__running):
+                self.__finish(job_id, 'cancelled', error='The server stopped')
+        for thread in self.__threads:
+            thread.join()
+        # the workers are not daemonic (they may start the processes of select_lambda)
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        with self.__lock:
+            for reader in self.__pipes.values():
+                reader.close()
+            self.__pipes.clear()
+
+    def __cache_file(self, key):
+        """Return the file caching the result of the job key."""
+        return os.path.join(self.directory, 'cache', f'{key}.json')
+
+    def submit(self, spec):
+        """Queue a job and return its summary.
+
+        Parameters
+        ----------
+        spec: dictionary with the 'type' of the job (ingest, forward, inversion or sweep),
+              the input 'files' (supersting files), the 'params' of the job and its
+              'priority' (the largest first, default 0). The params of the inversion and
+              sweep jobs include the 'offsets' of the files (see merge_surveys) and the
+              'lambda_workers' of the lambda selection (default 1, in the job's worker).
+
+        Example-- submit({'type': 'inversion', 'files': ['MSU130SH.stg'],
+                          'params': {'quality_control': {'max_error': 0.1}, 'lam': 'auto'}})
+        """
+        kind = spec.get('type')
+        if kind not in JOB_TYPES:
+            raise ValueError(f"{kind} is not a valid job type. Use one of {JOB_TYPES}")
+        files = spec.get('files', [])
+        files = [os.path.abspath(file) for file in ([files] if isinstance(files, str) else files)]
+        for file in files:
+            if not os.path.isfile(file):
+                raise ValueError(f"{file} does not exist")
+        if kind != 'forward' and not files:
+            raise ValueError(f"A {kind} job needs supersting files")
+        params = spec.get('params', {})
+        key = job_key(kind, files, params)
+
+        with self.__lock:
+            # an identical job is returned unless it failed or was cancelled
+            if key in self.__keys and self.jobs[self.__keys[key]]['status'] in [
+                    'queued', 'running', 'done']:
+                return dict(self.__summary(self.__keys[key]), duplicate=True)
+
+            job_id = uuid.uuid4().hex[:12]
+            self.jobs[job_id] = {'job_id': job_id, 'key': key, 'type': kind, 'files': files,
+                                 'params': params, 'priority': int(spec.get('priority', 0)),
+                                 'status': 'queued', 'submitted': time.time(),
+                                 'started': None, 'finished': None, 'result': None,
+                                 'error': None, 'cached': False, 'events': []}
+            self.__keys[key] = job_id
+
+            if os.path.isfile(self.__cache_file(key)):
+                with open(self.__cache_file(key), 'r', encoding='utf-8') as files_:
+                    result = json.load(files_)
+                self.jobs[job_id]['cached'] = True
+                self.jobs[job_id]['events'].append({'event': 'done', 'time': time.time(),
+                                                    'result': result, 'cached': True})
+                self.__finish(job_id, 'done', result=result)
+            else:
+                heapq.heappush(self.__queue, (-self.jobs[job_id]['priority'],
+                                              next(self.__order), job_id))
+                self.__lock.notify_all()
+            return self.__summary(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job and return its summary."""
+        with self.__lock:
+            self.__job(job_id)
+            if self.jobs[job_id]['status'] in ['queued', 'running']:
+                self.__finish(job_id, 'cancelled')
+            return self.__summary(job_id)
+
+    def status(self, job_id=None):
+        """Return the summary of a job, or of all the jobs if job_id is None."""
+        with self.__lock:
+            if job_id is None:
+                return [self.__summary(job) for job in self.jobs]
+            self.__job(job_id)
+            return self.__summary(job_id)
+
+    def wait_events(self, job_id, start=0, timeout=1.0):
+        """Return the events of a job from start (waiting up to timeout for new ones).
+
+        return
+        ------
+        The list of the events and True if the job is finished.
+        """
+        with self.__lock:
+            job = self.__job(job_id)
+            if len(job['events']) <= start and job['status'] not in FINISHED:
+                self.__lock.wait(timeout)
+            return job['events'][start:], job['status'] in FINISHED
+
+    def __job(self, job_id):
+        """Return the job, the lock must be held."""
+        if job_id not in self.jobs:
+            raise ValueError(f"{job_id} is not a job of the server")
+        return self.jobs[job_id]
+
+    def __summary(self, job_id):
+        """Return the job without its events, the lock must be held."""
+        job = self.jobs[job_id]
+        summary = {key: value for key, value in job.items() if key != 'events'}
+        summary['events'] = len(job['events'])
+        summary['queue_position'] = None
+        if job['status'] == 'queued':
+            summary['queue_position'] = sorted(self.__queue).index(
+                next(item for item in self.__queue if item[2] == job_id))
+        return summary
+
+    def __finish(self, job_id, status, result=None, error=None):
+        """Set the final status of the job, the lock must be held."""
+        job = self.jobs[job_id]
+        if job['status'] in FINISHED:
+            return
+        process = self.__running.pop(job_id, None)
+        if process is not None and status == 'cancelled':
+            process.terminate()
+        self.__queue = [item for item in self.__queue if item[2] != job_id]
+        heapq.heapify(self.__queue)
+        job.update(status=status, finished=time.time(), result=result, error=error)
+        if status != 'done':
+            job['events'].append({'event': status, 'time': job['finished'], 'error': error})
+        elif not job['cached']:
+            with open(self.__cache_file(job['key']), 'w', encoding='utf-8') as files:
+                json.dump(result, files, default=str)
+        self.__lock.notify_all()
+
+    def __schedule(self):
+        """Start the queued jobs by priority while fewer than workers jobs are running."""
+        while not self.__stop.is_set():
+            with self.__lock:
+                while self.__queue and len(self.__running) < self.workers:
+                    _, _, job_id = heapq.heappop(self.__queue)
+                    job = self.jobs[job_id]
+                    reader, writer = self.__context.Pipe(duplex=False)
+                    process = self.__context.Process(
+                        target=_run_job, daemon=False,
+                        args=(job_id, job['type'], job['files'], job['params'], self.directory,
+                              writer, self.threads))
+                    process.start()
+                    writer.close()  # only the worker writes
+                    self.__running[job_id] = process
+                    self.__pipes[job_id] = reader
+                    job.update(status='running', started=time.time())
+                    job['events'].append({'event': 'started', 'time': job['started']})
+                    self.__lock.notify_all()
+                self.__lock.wait(0.5)
+
+    def __collect(self):
+        """Append the events sent by the workers to their jobs."""
+        while not self.__stop.is_set():
+            with self.__lock:
+                pipes = dict(self.__pipes)
+            if not pipes:
+                time.sleep(0.1)
+                continue
+            for reader in wait(list(pipes.values()), timeout=0.5):
+                job_id = next(key for key, value in pipes.items() if value is reader)
+                try:
+                    event = reader.recv()
+                except (EOFError, OSError):
+                    self.__worker_exited(job_id)
+                    continue
+                self.__add_event(job_id, event)
+
+    def __worker_exited(self, job_id):
+        """Close the pipe of an exited worker, its job fails if it did not report (e.g. killed)."""
+        with self.__lock:
+            self.__pipes.pop(job_id).close()
+            process = self.__running.get(job_id)
+            if process is not None:
+                process.join(5)
+                self.__finish(job_id, 'failed',
+                              error=f'The worker exited with code {process.exitcode}')
+
+    def __add_event(self, job_id, event):
+        """Append the event sent by the worker to its job."""
+        with self.__lock:
+            job = self.jobs[job_id]
+            if job['status'] in FINISHED:
+                return  # e.g. the last events of a cancelled job
+            if event['event'] == 'done':
+                job['events'].append(event)
+                self.__finish(job_id, 'done', result=event['result'])
+            elif event['event'] == 'error':
+                self.__finish(job_id, 'failed', error=event['error'])
+            else:
+                job['events'].append(event)
+                self.__lock.notify_all()
+
+
+def _handler(jobs):
+    """Return the request handler of the HTTP server of the JobServer jobs."""
+
+    class Handler(BaseHTTPRequestHandler):
+        """Handle the requests of the job endpoints."""
+
+        def __send(self, body, code=200):
+            """Send a JSON response."""
+            payload = json.dumps(body, default=str).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def __route(self):
+            """Return the job_id and the sub-path of the request (None if not a job path)."""
+            parts = [part for part in self.path.split('?')[0].split('/') if part]
+            if not parts or parts[0] != 'jobs' or len(parts) > 3:
+                return None, None
+            return (parts[1] if len(parts) > 1 else None), (parts[2] if len(parts) > 2 else None)
+
+        def __call(self, func, *args):
+            """Send the output of the function, or its error."""
+            try:
+                self.__send(func(*args))
+            except ValueError as error:
+                self.__send({'error': str(error)}, 404 if 'is not a job' in str(error) else 400)
+
+        def do_POST(self):  # noqa: N802, the name is set by BaseHTTPRequestHandler
+            """Submit a job."""
+            if self.path.split('?')[0].strip('/') != 'jobs':
+                return self.__send({'error': 'Use POST /jobs'}, 404)
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                spec = json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError as error:
+                return self.__send({'error': f'Invalid JSON: {error}'}, 400)
+            return self.__call(jobs.submit, spec)
+
+        def do_GET(self):  # noqa: N802
+            """Return the jobs, a job, or stream the events of a job."""
+            if self.path.split('?')[0].strip('/') == 'jobs':
+                return self.__send(jobs.status())
+            job_id, sub = self.__route()
+            if job_id is None or sub not in [None, 'events']:
+                return self.__send({'error': 'Unknown path'}, 404)
+            if sub is None:
+                return self.__call(jobs.status, job_id)
+
+            try:
+                jobs.status(job_id)
+            except ValueError as error:
+                return self.__send({'error': str(error)}, 404)
+            # the events are streamed as JSON lines until the job is finished
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            sent, finished = 0, False
+            try:
+                while not finished:
+                    events, finished = jobs.wait_events(job_id, sent)
+                    for event in events:
+                        self.wfile.write((json.dumps(event, default=str) + '\n').encode('utf-8'))
+                    self.wfile.flush()
+                    sent += len(events)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client stopped listening
+            return None
+
+        def do_DELETE(self):  # noqa: N802
+            """Cancel a job."""
+            job_id, sub = self.__route()
+            if job_id is None or sub is not None:
+                return self.__send({'error': 'Use DELETE /jobs/<job_id>'}, 404)
+            return self.__call(jobs.cancel, job_id)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            """Do not log the requests (the streams would flood the console)."""
+
+    return Handler
+
+
+def make_server(jobs, host='127.0.0.1', port=8765):
+    """Return the HTTP server (ThreadingHTTPServer) of the JobServer jobs."""
+    return ThreadingHTTPServer((host, port), _handler(jobs))
+
+
+def serve(host='127.0.0.1', port=8765, directory='jobs', workers=2, threads=None):
+    """Run the job server until it is interrupted (Ctrl+C)."""
+    jobs = JobServer(directory, workers=workers, threads=threads)
+    jobs.start()
+    httpd = make_server(jobs, host, port)
+    print(f"Job server on http://{host}:{httpd.server_address[1]} with {workers} workers")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        jobs.stop()
+
+
+def _request(url, method='GET', body=None):
+    """Send a request to the job server and return the decoded JSON response."""
+    data = None if body is None else json.dumps(body).encode('utf-8')
+    request = urllib.request.Request(url, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def submit(url, spec):
+    """Submit a job to the job server at url and return its summary, see JobServer.submit.
+
+    The files are sent as absolute paths, as the server may run in another directory.
+    """
+    files = spec.get('files', [])
+    files = [os.path.abspath(file) for file in ([files] if isinstance(files, str) else files)]
+    return _request(f"{url.rstrip('/')}/jobs", 'POST', dict(spec, files=files))
+
+
+def status(url, job_id=None):
+    """Return the summary of a job (or of all the jobs) of the job server at url."""
+    return _request(f"{url.rstrip('/')}/jobs" + ('' if job_id is None else f'/{job_id}'))
+
+
+def cancel(url, job_id):
+    """Cancel a job of the job server at url."""
+    return _request(f"{url.rstrip('/')}/jobs/{job_id}", 'DELETE')
+
+
+def stream(url, job_id):
+    """Yield the events of a job of the job server at url until the job is finished."""
+    with urllib.request.urlopen(f"{url.rstrip('/')}/jobs/{job_id}/events") as response:
+        for line in response:
+            yield json.loads(line)
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description='Local job server of the root_simulator')
+    PARSER.add_argument('--host', default='127.0.0.1')
+    PARSER.add_argument('--port', type=int, default=8765)
+    PARSER.add_argument('--directory', default='jobs', help='outputs and cache directory')
+    PARSER.add_argument('--workers', type=int, default=2, help='maximum running jobs')
+    PARSER.add_argument('--threads', type=int, default=None, help='threads of each job')
+    ARGS = PARSER.parse_args()
+    serve(ARGS.host, ARGS.port, ARGS.directory, ARGS.workers, ARGS.threads)
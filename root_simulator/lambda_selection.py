@@ -0,0 +1,168 @@
+"""The lambda_selection module chooses the regularization strength (lambda) of an inversion.
+
+A ladder of decreasing lambda values is inverted. Only the largest lambda is inverted from the
+homogeneous model (cold start); the other lambdas are inverted along chains of warm starts:
+each inversion starts from the model of its neighbour on the chain (the next larger lambda)
+and is limited to warm_iter iterations (one by default). With several processes, each process
+inverts every workers-th lambda of the ladder, so the chains run in parallel and are still
+made of neighbouring lambdas. The ladder costs about one full inversion plus one iteration per
+lambda (divided by the number of processes), and the model of the chosen lambda is returned,
+so it is not inverted again. The lambda is chosen on the L-curve (maximum curvature of the
+data misfit vs. model roughness in log-log) or with the discrepancy principle (largest lambda
+fitting the data to the target chi²).
+
+Dependence: concurrent.futures, tempfile, numpy, pygimli
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+import tempfile
+import numpy as np
+import pygimli as pg
+from pygimli.physics import ert
+import instrumentation as ins
+
+# the number of processes inverting the lambda ladder, each process holds its own copy of the
+# mesh and Jacobian
+DEFAULT_WORKERS = 2
+
+
+def lambda_ladder(lam_max=1000, lam_min=1, num=12):
+    """Return num lambda values logarithmically spaced from lam_max down to lam_min."""
+    return np.logspace(np.log10(lam_max), np.log10(lam_min), num)
+
+
+def _create_inversion(data, mesh, background=True):
+    """Create the ERT inversion of the data on the mesh, as in RootSimulator2.inverse_simulation.
+
+    The region 1 (the boundary appended to the parameter domain) is the background.
+    """
+    simulate = ert.ERTModelling(sr=False)
+    simulate.setMesh(mesh)
+    simulate.data = data
+    if background:
+        simulate.setRegionProperties(1, background=True)
+    trans_log = pg.trans.TransLog()
+    inversion = pg.Inversion(fop=simulate, verbose=False)
+    inversion.transData = trans_log
+    inversion.transModel = trans_log
+    return inversion
+
+
+def _result(lam, model, inversion):
+    """Return the model, the response and the misfits of the inversion with lam."""
+    return {'lam': float(lam), 'model': np.array(model),
+            'response': np.array(inversion.response), 'chi2': float(inversion.chi2()),
+            'phi_d': float(inversion.phiData()), 'phi_m': float(inversion.phiModel())}
+
+
+def _invert_chain(data_file, mesh_file, lambdas, start_model, warm_iter, background):
+    """Invert the lambdas of a chain, each starting from the model of the previous one.
+
+    The first lambda starts from start_model (the model of the largest lambda). The data and
+    mesh are read from files, as the pygimli objects cannot be sent to the worker processes.
+    """
+    data = pg.DataContainerERT(data_file)
+    inversion = _create_inversion(data, pg.load(mesh_file), background)
+
+    results, model = [], start_model
+    for lam in lambdas:
+        model = inversion.run(data['rhoa'], data['err'], lam=lam, startModel=model,
+                              maxIter=warm_iter)
+        results.append(_result(lam, model, inversion))
+    return results
+
+
+def lcurve_corner(phi_d, phi_m):
+    """Return the index of the point of maximum curvature of the L-curve (log-log)."""
+    x_val, y_val = np.log10(phi_d), np.log10(phi_m)
+    dx_val, dy_val = np.gradient(x_val), np.gradient(y_val)
+    ddx_val, ddy_val = np.gradient(dx_val), np.gradient(dy_val)
+    # with decreasing lambda, the misfit decreases and the roughness increases: the corner
+    # is the sharpest clockwise turn
+    curvature = (dy_val * ddx_val - dx_val * ddy_val) / (dx_val ** 2 + dy_val ** 2) ** 1.5
+    # the end points have no meaningful curvature
+    curvature[[0, -1]] = -np.inf
+    return int(np.nanargmax(curvature))
+
+
+def discrepancy_index(lambdas, chi2, target=1.0):
+    """Return the index of the largest lambda whose chi² reaches the target (else the best fit)."""
+    fitting = np.nonzero(np.asarray(chi2) <= target)[0]
+    if len(fitting) == 0:
+        return int(np.argmin(chi2))
+    return int(fitting[np.argmax(np.asarray(lambdas)[fitting])])
+
+
+def select_lambda(data, mesh, lambdas=None, criterion='lcurve', target_chi2=1.0,
+                  workers=DEFAULT_WORKERS, warm_iter=1, background=True):
+    """Invert a ladder of lambda values in parallel and return the chosen model.
+
+    Parameters
+    ----------
+    data: DataContainerERT with the 'rhoa' and 'err' (relative) values.
+    mesh: the inversion mesh (e.g. created by createParaMesh).
+    lambdas: the lambda values. Default is lambda_ladder().
+    criterion: 'lcurve' (maximum curvature) or 'discrepancy' (chi² = target_chi2).
+    target_chi2: the chi² aimed at by the discrepancy principle.
+    workers: the number of chains of warm-started lambdas inverted in parallel (at most one
+             per lambda). With one worker, the ladder is one chain inverted in this process.
+    warm_iter: the maximum number of iterations of the warm-started inversions.
+    background: the region 1 of the mesh is the background (not inverted).
+
+    return
+    ------
+    A dictionary with the chosen 'lam', 'model' and its 'response', and the curve data:
+    'lambdas', 'chi2', 'phi_d', 'phi_m', 'models' for each lambda and the 'index' of the
+    chosen one.
+    """
+    if criterion not in ['lcurve', 'discrepancy']:
+        raise ValueError(f"{criterion} is not a valid criterion. Use 'lcurve' or 'discrepancy'")
+    lambdas = np.sort(lambda_ladder() if lambdas is None else np.asarray(lambdas, float))[::-1]
+    if len(lambdas) < 3:
+        raise ValueError("At least three lambda values are needed")
+    workers = max(1, min(workers or 1, len(lambdas) - 1))
+
+    tmpdir = tempfile.mkdtemp(prefix='lambda_selection_')
+    try:
+        data_file = os.path.join(tmpdir, 'data.dat')
+        mesh_file = os.path.join(tmpdir, 'mesh.bms')
+        data.save(data_file, 'a b m n rhoa err')
+        mesh.save(mesh_file)
+
+        with ins.span('select_lambda', lambdas=len(lambdas), workers=workers,
+                      **ins.mesh_info(mesh)):
+            # cold start at the largest lambda, the other lambdas start from its model
+            inversion = _create_inversion(data, mesh, background)
+            model = inversion.run(data['rhoa'], data['err'], lam=lambdas[0])
+            results = [_result(lambdas[0], model, inversion)]
+            start_model = results[0]['model']
+
+            # the chain of each worker takes every workers-th lambda of the ladder
+            chains = [lambdas[1 + ind::workers] for ind in range(workers)]
+            if workers == 1:
+                results += _invert_chain(data_file, mesh_file, chains[0], start_model,
+                                         warm_iter, background)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = [pool.submit(_invert_chain, data_file, mesh_file, chain,
+                                           start_model, warm_iter, background)
+                               for chain in chains]
+                    results += [res for future in futures for res in future.result()]
+            results.sort(key=lambda res: -res['lam'])
+            for res in results:
+                ins.record('lambda', lam=res['lam'], chi2=res['chi2'])
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    curve = {key: np.array([res[key] for res in results])
+             for key in ['lam', 'chi2', 'phi_d', 'phi_m']}
+    if criterion == 'lcurve':
+        index = lcurve_corner(curve['phi_d'], curve['phi_m'])
+    else:
+        index = discrepancy_index(curve['lam'], curve['chi2'], target_chi2)
+
+    return {'lam': float(curve['lam'][index]), 'model': results[index]['model'],
+            'response': results[index]['response'], 'index': index, 'lambdas': curve['lam'],
+            'chi2': curve['chi2'], 'phi_d': curve['phi_d'], 'phi_m': curve['phi_m'],
+            'models': np.array([res['model'] for res in results])}
@@ -0,0 +1,99 @@
+"""The pseudosection module renders the apparent resistivity of large datasets.
+
+Each measurement is placed at the midpoint of its electrodes and at its depth of
+investigation (pseudo-depth). Instead of drawing one marker per measurement, the values are
+aggregated (median by default) on a regular grid of bins, and the grid is rendered as a single
+image. Hence the rendering time does not depend on the number of measurements.
+
+Dependence: numpy, matplotlib, survey_geometry
+"""
+import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
+import numpy as np
+import survey_geometry as sgeo
+
+
+def pseudo_positions(a_pos, b_pos, m_pos, n_pos):
+    """Return the midpoint and the pseudo-depth of each measurement (any electrode configuration).
+
+    The midpoint is the center of the four electrodes, the pseudo-depth is the median depth of
+    investigation of the electrode configuration (survey_geometry.depth_of_investigation).
+    """
+    stacked = np.vstack([np.asarray(pos, dtype=float) for pos in (a_pos, b_pos, m_pos, n_pos)])
+    midpoint = (stacked.max(axis=0) + stacked.min(axis=0)) / 2
+    return midpoint, sgeo.depth_of_investigation(a_pos, b_pos, m_pos, n_pos)
+
+
+def bin_pseudosection(x_pos, depth, values, bins=(100, 40), agg='median'):
+    """Aggregate the values in a regular grid of bins.
+
+    Parameters
+    ----------
+    x_pos, depth: position and pseudo-depth of each value.
+    values: the values to aggregate (e.g. apparent resistivity).
+    bins: number of bins, an integer or (number along x, number along the depth).
+    agg: 'median' or 'mean' of the values within each bin.
+
+    return
+    ------
+    grid (depth bins, x bins) with NaN in the empty bins, x edges, depth edges.
+    """
+    if agg not in ['median', 'mean']:
+        raise ValueError(f"{agg} is not a valid aggregation. Use 'median' or 'mean'")
+    x_pos, depth, values = (np.asarray(arr, dtype=float).ravel() for arr in (x_pos, depth, values))
+    if not len(x_pos) == len(depth) == len(values):
+        raise ValueError("x_pos, depth and values must have the same length")
+
+    n_x, n_z = (bins, bins) if np.isscalar(bins) else bins
+    x_edges = np.linspace(x_pos.min(), x_pos.max(), n_x + 1)
+    z_edges = np.linspace(depth.min(), depth.max(), n_z + 1)
+    # index of the bin of each value, the values on the last edge belong to the last bin
+    i_x = np.clip(np.searchsorted(x_edges, x_pos, side='right') - 1, 0, n_x - 1)
+    i_z = np.clip(np.searchsorted(z_edges, depth, side='right') - 1, 0, n_z - 1)
+    flat = i_z * n_x + i_x
+
+    grid = np.full(n_x * n_z, np.nan)
+    if agg == 'mean':
+        counts = np.bincount(flat, minlength=n_x * n_z)
+        sums = np.bincount(flat, weights=values, minlength=n_x * n_z)
+        grid[counts > 0] = sums[counts > 0] / counts[counts > 0]
+    else:
+        # sort by bin then by value, the median is in the middle of each bin's run
+        order = np.lexsort((values, flat))
+        flat, values = flat[order], values[order]
+        filled, start, counts = np.unique(flat, return_index=True, return_counts=True)
+        grid[filled] = (values[start + (counts - 1) // 2] + values[start + counts // 2]) / 2
+
+    return grid.reshape(n_z, n_x), x_edges, z_edges
+
+
+def show_pseudosection(x_pos, depth, values, bins=(100, 40), agg='median', ax=None,
+                       log_scale=True, cmap='Spectral_r', **kwargs):
+    """Plot the binned pseudosection as a single image.
+
+    Parameters
+    ----------
+    x_pos, depth, values, bins, agg: see bin_pseudosection.
+    ax: matplotlib axis, a new figure is created if not given.
+    log_scale: use a logarithmic color scale.
+    kwargs: passed to imshow (e.g. vmin, vmax).
+
+    return
+    ------
+    The axis and the image.
+    """
+    grid, x_edges, z_edges = bin_pseudosection(x_pos, depth, values, bins=bins, agg=agg)
+    if ax is None:
+        _, ax = plt.subplots(figsize=(10, 7))
+    if log_scale:
+        kwargs['norm'] = LogNorm(vmin=kwargs.pop('vmin', np.nanmin(grid)),
+                                 vmax=kwargs.pop('vmax', np.nanmax(grid)))
+
+    # the first row (shallowest bins) is drawn at the top
+    image = ax.imshow(grid, extent=(x_edges[0], x_edges[-1], z_edges[-1], z_edges[0]),
+                      aspect='auto', interpolation='nearest', cmap=cmap, **kwargs)
+    ax.set_xlabel('Distance (m)')
+    ax.xaxis.tick_top()
+    ax.xaxis.set_label_position('top')
+    ax.set_ylabel('Depth (m)')
+    return ax, image
@@ -3,8 +3,10 @@ import os
 import numpy as np
 import pybert as pb
 import pygimli as pg
+import instrumentation as ins
 
 
+@ins.instrumented()
 def supersting_processing(file, col=(-4, -1), row=1, save_file=False):
     """Read in the supersting file and extract the measured res. values and electrodes arrangement.
 
@@ -30,12 +32,8 @@ def supersting_processing(file, col=(-4, -1), row=1, save_file=False):
     with open(file, 'r', encoding='utf-8') as fil:
         supersting_file = fil.readlines()
 
-    # Get the number of records automatically
-    for char in range(5, 1, -1):
-        last_line = supersting_file[1][-char:-1]  # The number of records may not exceed 10,000s
-        if isinstance(int(last_line), int):
-            check_col = int(last_line)
-            break
+    # Get the number of records automatically, it ends the second line of the header
+    check_col = int(supersting_file[1].split()[-1])
 
     if type(int(supersting_file[row][col[0]:col[1]])) not in [int]:
         raise ValueError('Please make sure you enter the correct col position')
@@ -56,10 +54,11 @@ def supersting_processing(file, col=(-4, -1), row=1, save_file=False):
     data = np.ones((record, len(relevant_col)))
 
     # extract each line of the supersting file and separate each information. filling the array
-    for i, _ in enumerate(supersting):
-        line = supersting[i].replace(',', " ").split()
-        for j, _ in enumerate(relevant_col):
-            data[i][j] = line[relevant_col[j]]
+    with ins.span('parse_records', records=record):
+        for i, _ in enumerate(supersting):
+            line = supersting[i].replace(',', " ").split()
+            for j, _ in enumerate(relevant_col):
+                data[i][j] = line[relevant_col[j]]
 
     if save_file:
         np.savetxt(f"{file[:-4]}_res.dat", data, header='R rhoa A(xyz) B(xyz) M(xyz) N(xyz)')
@@ -67,6 +66,7 @@ def supersting_processing(file, col=(-4, -1), row=1, save_file=False):
     return data
 
 
+@ins.instrumented()
 def standardized_bert(file_name, precision=2, save_file=False):
     """Standardized_bert function returns the required data needed for the (PyGIMLi) BERT model.
 
@@ -137,6 +137,7 @@ def standardized_bert(file_name, precision=2, save_file=False):
     data.markValid(data('rhoa') > 0)
     data.checkDataValidity()
     data.sortSensorsX()
+    ins.record('data', sensors=data.sensorCount(), data=data.size())
 
     # save the file in .dat format and can be visualized using notepad or any text application.
     if save_file:
@@ -145,3 +146,92 @@ def standardized_bert(file_name, precision=2, save_file=False):
         pb.exportData(data, f'{file_name[:-4]}.dat')
 
     return data
+
+
+def _remap(index, mapping):
+    """Map the electrode indices to the merged sensors, keeping -1 (missing electrode)."""
+    return np.where(index >= 0, mapping[np.maximum(index, 0)], -1)
+
+
+@ins.instrumented()
+def merge_surveys(files, offsets=None, precision=2, save_file=False):
+    """Merge several (roll-along) supersting files into a single DataContainerERT.
+
+    Dependencies: numpy, pybert, pygimli
+
+    The files are processed one after the other with standardized_bert. The electrodes at the
+    same position (rounded as in standardized_bert) are unified into one sensor, the ABMN
+    indices of the readings are remapped to the merged sensors, and the readings of the same
+    ABMN configuration recorded in several files (the overlap) are kept once, from the first
+    file. Only the merged data and one file are held in memory at a time.
+
+    Parameters
+    ----------
+    files: list of the supersting input files (*.stg).
+    offsets: list of the x-offset of each file, if the positions of the files are relative
+             to the start of each line. Default is no offset.
+    precision: default is set to 2, see standardized_bert.
+    save_file: boolean. To save the merged data as merged.dat in the directory of the first
+               file.
+    """
+    if len(files) == 0:
+        raise ValueError("At least one supersting file is needed")
+    if offsets is None:
+        offsets = np.zeros(len(files))
+    if len(offsets) != len(files):
+        raise ValueError("offsets must contain one value for each file")
+
+    pseudo_data = 100 ** precision
+    tokens = ['rhoa', 'err', 'i', 'u', 'ip'] + ['ip' + str(i + 1) for i in range(6)]
+    sensors = np.zeros((0, 3))
+    abmn = np.zeros((0, 4), dtype=int)
+    values = {}
+
+    for file, offset in zip(files, offsets):
+        with ins.span('merge_file', file=file):
+            data = standardized_bert(file, precision=precision)
+            positions = np.array(data.sensorPositions()) + [offset, 0, 0]
+            positions = np.fix(positions * pseudo_data) / pseudo_data + 0.0
+            file_abmn = np.vstack([np.array(data[tok], dtype=int)
+                                   for tok in ['a', 'b', 'm', 'n']]).T
+
+            # shared spatial index: the sensors at the same position get the same number
+            n_old = len(sensors)
+            sensors, inverse = np.unique(np.vstack((sensors, positions)), axis=0,
+                                         return_inverse=True)
+            inverse = inverse.ravel()
+            abmn = np.vstack((_remap(abmn, inverse[:n_old]),
+                              _remap(file_abmn, inverse[n_old:])))
+
+            # the tokens missing in one of the files are filled with zeros
+            n_merged = len(abmn) - data.size()
+            for tok in tokens:
+                if tok in values or data.haveData(tok):
+                    old = values.get(tok, np.zeros(n_merged))
+                    new = np.array(data[tok]) if data.haveData(tok) else np.zeros(data.size())
+                    values[tok] = np.concatenate((old, new))
+
+            # keep the first reading of each ABMN configuration
+            _, first = np.unique(abmn, axis=0, return_index=True)
+            first = np.sort(first)
+            abmn = abmn[first]
+            values = {tok: val[first] for tok, val in values.items()}
+
+    merged = pg.DataContainerERT()
+    for ipos in sensors:
+        merged.createSensor(ipos)
+    merged.resize(len(abmn))
+    for i, tok in enumerate(['a', 'b', 'm', 'n']):
+        merged.set(tok, abmn[:, i])
+    for tok, val in values.items():
+        merged.set(tok, val)
+
+    merged.markValid(merged('rhoa') > 0)
+    merged.checkDataValidity()
+    merged.sortSensorsX()
+    ins.record('data', sensors=merged.sensorCount(), data=merged.size())
+
+    if save_file:
+        pb.exportData(merged, os.path.join(os.path.dirname(files[0]), 'merged.dat'))
+
+    return merged
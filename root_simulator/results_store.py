@@ -0,0 +1,186 @@
+"""The results_store module saves the inversion results to reuse them without recomputing.
+
+Each inversion (run) is saved in its own sub-directory of the store:
+
+    <store>/<run_id>/meta.json     settings, chi², provenance (data files, versions, date)
+    <store>/<run_id>/mesh.bms      the mesh of the model (parameter domain)
+    <store>/<run_id>/<name>.npy    the model, response, coverage... vectors
+
+Listing and filtering the runs only reads the meta.json files, the vectors are memory-mapped
+and the mesh is loaded when first accessed.
+
+Dependence: json, hashlib, numpy, pygimli
+
+Example
+-------
+    store = ResultsStore('results')
+    simulate_data.inverse_simulation(store=store)
+    run = store.query(data_file='MSU130SH.stg')[-1]
+    simulate_data.plot_inverse(min_res=100, max_res=1500, run=store.load(run['run_id']))
+"""
+import datetime
+import hashlib
+import json
+import os
+import platform
+import shutil
+import numpy as np
+import pygimli as pg
+
+
+def file_digest(file):
+    """Return the sha256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(file, 'rb') as files:
+        for block in iter(lambda: files.read(2 ** 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StoredRun:
+    """A run of the store, the mesh and the vectors are loaded when first accessed.
+
+    Attributes
+    ----------
+    run_id: the identifier of the run in the store.
+    meta: dictionary of the settings, chi², provenance and the names of the vectors.
+    mesh: the mesh of the model (pygimli Mesh).
+    model, response, coverage...: the vectors saved with the run (memory-mapped numpy arrays).
+    """
+
+    def __init__(self, path):
+        """Read the meta data of the run saved in path."""
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as files:
+            self.meta = json.load(files)
+        self.run_id = self.meta['run_id']
+        self.__mesh = None
+
+    @property
+    def mesh(self):
+        """Load the mesh of the run."""
+        if self.__mesh is None:
+            self.__mesh = pg.load(os.path.join(self.path, 'mesh.bms'))
+        return self.__mesh
+
+    @property
+    def chi2(self):
+        """Return the chi² of the run."""
+        return self.meta.get('chi2')
+
+    @property
+    def settings(self):
+        """Return the settings of the run."""
+        return self.meta.get('settings', {})
+
+    def __getattr__(self, name):
+        """Memory-map the vector 'name' of the run."""
+        if name in self.__dict__.get('meta', {}).get('arrays', []):
+            return np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+        raise AttributeError(f"The run has no {name}")
+
+
+class ResultsStore:
+    """Save, list and load inversion results in a directory.
+
+    Parameter
+    ---------
+    directory: the directory of the store, created if it does not exist.
+
+    Functions
+    ---------
+    save: saves the mesh, the vectors, the settings and the provenance of a run.
+    query: lists the runs, optionally filtered on their meta data.
+    load: returns a run (StoredRun) with lazy loading of the mesh and vectors.
+    delete: removes a run.
+    """
+
+    def __init__(self, directory='results'):
+        """Create the directory of the store."""
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, mesh, model, chi2=None, settings=None, data_files=None, name='', **arrays):
+        """Save a run and return its identifier.
+
+        Parameters
+        ----------
+        mesh: the mesh of the model (e.g. the paraDomain of the inversion).
+        model: the model vector (resistivity of each cell).
+        chi2: the chi² of the inversion.
+        settings: dictionary of the settings of the inversion (lam, mesh quality...).
+        data_files: the data file(s) inverted, their sha256 digest is saved as provenance.
+        name: a free description of the run.
+        arrays: other vectors to save, e.g. response=..., coverage=...
+        """
+        created = datetime.datetime.now()
+        run_id = created.strftime('%Y%m%d-%H%M%S-%f')
+        path = os.path.join(self.directory, run_id)
+        os.makedirs(path)
+
+        mesh.save(os.path.join(path, 'mesh.bms'))
+        arrays['model'] = model
+        saved = []
+        for key, value in arrays.items():
+            if value is None:
+                continue
+            np.save(os.path.join(path, f'{key}.npy'), np.asarray(value))
+            saved.append(key)
+
+        if isinstance(data_files, str):
+            data_files = [data_files]
+        meta = {'run_id': run_id, 'name': name, 'created': created.isoformat(),
+                'chi2': None if chi2 is None else float(chi2), 'settings': settings or {},
+                'arrays': saved, 'cells': mesh.cellCount(), 'nodes': mesh.nodeCount(),
+                'provenance': {
+                    'data_files': [os.path.abspath(file) for file in data_files or []],
+                    'data_sha256': [file_digest(file) for file in data_files or []],
+                    'pygimli': pg.__version__, 'python': platform.python_version(),
+                    'host': platform.node()}}
+        # meta.json is written last, a run without it is incomplete and ignored
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as files:
+            json.dump(meta, files, indent=2, default=str)
+        return run_id
+
+    def query(self, where=None, **equals):
+        """Return the meta data of the runs (oldest first) matching the filters.
+
+        Parameters
+        ----------
+        where: function taking the meta data of a run and returning True to keep it.
+        equals: meta data or settings values, e.g. query(name='MSU130', lam=20). The key
+                'data_file' matches the name of one of the inverted files.
+
+        Example-- store.query(where=lambda meta: meta['chi2'] < 2, method='inverse_simulation')
+        """
+        runs = []
+        for run_id in sorted(os.listdir(self.directory)):
+            meta_file = os.path.join(self.directory, run_id, 'meta.json')
+            if not os.path.isfile(meta_file):
+                continue
+            with open(meta_file, 'r', encoding='utf-8') as files:
+                meta = json.load(files)
+
+            keep = True
+            for key, value in equals.items():
+                if key == 'data_file':
+                    names = [os.path.basename(file)
+                             for file in meta['provenance']['data_files']]
+                    keep = keep and os.path.basename(value) in names
+                else:
+                    keep = keep and meta.get(key, meta['settings'].get(key)) == value
+            if keep and (where is None or where(meta)):
+                runs.append(meta)
+        return runs
+
+    def load(self, run_id):
+        """Return the run (StoredRun), the mesh and the vectors are loaded when accessed."""
+        path = os.path.join(self.directory, run_id)
+        if not os.path.isfile(os.path.join(path, 'meta.json')):
+            raise ValueError(f"{run_id} is not a run of the store {self.directory}")
+        return StoredRun(path)
+
+    def delete(self, run_id):
+        """Remove the run from the store."""
+        self.load(run_id)  # checks the run exists
+        shutil.rmtree(os.path.join(self.directory, run_id))
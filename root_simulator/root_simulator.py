@@ -1,6 +1,7 @@
 """The root_simulator module is the computational engine of the root_simulator package."""
 
 import os
+import time
 from pygimli.physics import ert
 from IPython.display import HTML, clear_output
 import imageio
@@ -9,6 +10,37 @@ import numpy as np
 import pygimli as pg
 import pygimli.meshtools as mt
 import read_res_data as rrd
+import data_qc as dqc
+import instrumentation as ins
+import survey_geometry as sgeo
+import pseudosection as ps
+import results_store as rs
+import lambda_selection as ls
+import ip_processing as ipp
+
+
+class _ERTModelling(ert.ERTModelling):
+    """ERTModelling measuring the Jacobian computations when the instrumentation is enabled."""
+
+    def createJacobian(self, model):
+        """Create the Jacobian of the model within a span."""
+        with ins.span('createJacobian', cells=len(model)):
+            return super().createJacobian(model)
+
+
+def _coverage(fop):
+    """Return the coverage (sum of absolute sensitivities per cell area) of the last Jacobian."""
+    sizes = np.array(fop.paraDomain.cellSizes())
+    return np.abs(pg.utils.gmat2numpy(fop.jacobian())).sum(axis=0) / sizes
+
+
+def _regular_grid(start, end, depth):
+    """Create the regular grid of the inversion, with an appended boundary (marker 1)."""
+    x_pos = np.linspace(start, end, 33)
+    y_pos = pg.cat([0], pg.utils.grange(0.5, depth, n=5))
+
+    inversion_domain = pg.createGrid(x=x_pos, y=y_pos[::-1], marker=2)
+    return pg.meshtools.appendBoundary(inversion_domain, marker=1, xbound=50, ybound=50)
 
 
 class RootSimulator:
@@ -24,6 +56,9 @@ class RootSimulator:
     Functions
     ----------
     create_geom: creates an arbitrary region of the subsurface with a specific feature.
+    create_mesh: creates the electrode configuration and a uniform mesh of the geometry.
+    create_adaptive_mesh: creates a mesh refined around the electrodes and the feature only.
+    refine_mesh: refines the mesh where the error of the forward solution is the largest.
     forward_model: simulates the resistivity distribution within the created mesh.
     inversion_2D: performs simulations and return the true resistivity model.
     animate_simulation: visualizes the results of the different array configuration.
@@ -45,7 +80,14 @@ class RootSimulator:
         self.__unstructured_mesh_inv = ''
         self.__inversion = ''
         self.__manager = ''  # will store the inverted data
-
+        self.__geom = ''  # The input parameters of create_geom, used to rebuild the geometry
+        self.__mesh_quality = 34
+        self.mesh_report = 'Run create_adaptive_mesh or refine_mesh'
+        self.__lam = 20  # The regularization strength of the inversions
+        self.lambda_curve = "Run inversion2d with lam='auto'"
+        self.run_id = 'Run inversion2d with a ResultsStore'
+
+    @ins.instrumented()
     def create_geom(self, x_ext, y_ext, layer, feature):
         """Create a 2D array using finite element method in the pygimli package.
 
@@ -84,19 +126,41 @@ class RootSimulator:
 
         # reassign the global y_ext
         self.__layer = layer
+        self.__geom = (x_ext, y_ext, layer, feature)
+        self.geometry = self.__build_geometry()
+
+        return self.geometry
+
+    def __build_geometry(self, world_area=0, feature_area=0):
+        """Create the world and the feature, the areas are the maximum cell sizes (0: free)."""
+        x_ext, y_ext, layer, feature = self.__geom
         # creates the dimension of the given size in the subsurface.
-        world = mt.createWorld(start=[y_ext, 0], end=x_ext, layers=layer, worldMarker=True)
+        world = mt.createWorld(start=[y_ext, 0], end=x_ext, layers=layer, worldMarker=True,
+                               area=world_area)
         # creates the feature architecture in the subsurface
-        root_feature = mt.createPolygon(feature, isClosed=True, addNodes=3, marker=4)
+        root_feature = mt.createPolygon(feature, isClosed=True, addNodes=3, marker=4,
+                                        area=feature_area)
         # integrate the feature to the layer under consideration.
-        self.geometry = world + root_feature
+        return world + root_feature
 
-        return self.geometry
+    def __create_scheme(self, scheme_name, start, end, num):
+        """Create the electrode configuration and update the global electrode variables."""
+        if scheme_name.lower() not in ['dd', 'wa', 'wb', 'pp', 'slm', 'pd']:
+            raise ValueError(f"{scheme_name} is not a valid scheme_name. Review documentation")
+
+        self.scheme = ert.createData(elecs=np.linspace(start=start, stop=end, num=num),
+                                     schemeName=scheme_name)
+        # Update the selected scheme
+        self.__sch = scheme_name
+        # reassign the global electrode configuration
+        self.__x_start = start
+        self.__x_stop = end
 
     def display_geometry(self):
         """Display all the components created at the subsurface."""
         return pg.show(self.geometry)
 
+    @ins.instrumented()
     def create_mesh(self, scheme_name, start=-30, end=30, num=21, mesh_quality=34):
         """create a desired electrode configuration used investigate feature.
 
@@ -110,24 +174,156 @@ class RootSimulator:
         mesh_quality: 34 should be the maximum. The smaller the mesh the faster the computation.
 
         """
-        if scheme_name.lower() not in ['dd', 'wa', 'wb', 'pp', 'slm', 'pd']:
-            raise ValueError(f"{scheme_name} is not a valid scheme_name. Review documentation")
-
-        self.scheme = ert.createData(elecs=np.linspace(start=start, stop=end, num=num),
-                                     schemeName=scheme_name)
-        # Update the selected scheme
-        self.__sch = scheme_name
+        self.__create_scheme(scheme_name, start, end, num)
         # incorporate the created electrode configuration scheme inside the geometry
         for pos in self.scheme.sensors():
             self.geometry.createNode(pos)
             # adds refinement nodes in a distance of 10% of electrode spacing
             self.geometry.createNode(pos - [0, 0.1])
 
-        # reassign the global electrode configuration
-        self.__x_start = start
-        self.__x_stop = end
+        self.__mesh_quality = mesh_quality
+        with ins.span('createMesh', quality=mesh_quality) as stage:
+            self.mesh = mt.createMesh(self.geometry, quality=mesh_quality)
+            stage.set(**ins.mesh_info(self.mesh))
+        return self.mesh
+
+    @ins.instrumented()
+    def create_adaptive_mesh(self, scheme_name, start=-30, end=30, num=21, mesh_quality=34,
+                             feature_area=None, world_area=0, rhomap=None):
+        """Create the electrode configuration and a mesh refined around the electrodes and feature.
+
+        The fine uniform mesh limits the area of every cell to feature_area. Here, the size of
+        the cells is controlled locally: refinement nodes are placed below and between the
+        electrodes, the cells of the feature are limited to feature_area, and the cells grow
+        freely (according to the mesh quality) toward the boundaries of the world. The cell
+        counts of both meshes are reported in mesh_report and, if rhomap is given, the largest
+        relative error of their apparent resistivity (see refine_mesh).
+
+        parameters
+        ----------
+        scheme_name, start, end, num, mesh_quality: see create_mesh.
+        feature_area: the maximum cell area within the feature, and of every cell of the
+                      uniform mesh. Default is a quarter of the squared electrode spacing.
+        world_area: the maximum cell area in the rest of the world, 0 leaves it unconstrained.
+        rhomap: resistivity of the regions (see plot_rhomap), to compare the accuracy of the
+                adaptive and uniform meshes.
+        """
+        if self.__geom == '':
+            raise ValueError("Run create_geom before creating the mesh")
+
+        self.__create_scheme(scheme_name, start, end, num)
+        spacing = (end - start) / (num - 1)
+        if feature_area is None:
+            feature_area = spacing ** 2 / 4
+
+        self.geometry = self.__build_geometry(world_area=world_area, feature_area=feature_area)
+        sensors = self.scheme.sensors()
+        for ind, pos in enumerate(sensors):
+            self.geometry.createNode(pos)
+            # refinement nodes below the electrode, the cells are the smallest at the electrodes
+            self.geometry.createNode(pos - [0, 0.1])
+            self.geometry.createNode(pos - [0, 0.3 * spacing])
+            # and between the electrodes
+            if ind < len(sensors) - 1:
+                self.geometry.createNode((pos + sensors[ind + 1]) / 2)
+
+        self.__mesh_quality = mesh_quality
+        with ins.span('createMesh', quality=mesh_quality) as stage:
+            self.mesh = mt.createMesh(self.geometry, quality=mesh_quality)
+            stage.set(**ins.mesh_info(self.mesh))
+
+        # the fine uniform mesh: same electrodes (as in create_mesh), every cell refined to the
+        # resolution of the feature
+        geometry = self.__build_geometry(world_area=feature_area, feature_area=feature_area)
+        for pos in sensors:
+            geometry.createNode(pos)
+            geometry.createNode(pos - [0, 0.1])
+        with ins.span('createMesh', quality=mesh_quality, area=feature_area) as stage:
+            uniform = mt.createMesh(geometry, quality=mesh_quality, area=feature_area)
+            stage.set(**ins.mesh_info(uniform))
+
+        self.mesh_report = {'cells': self.mesh.cellCount(), 'nodes': self.mesh.nodeCount(),
+                            'uniform_cells': uniform.cellCount(),
+                            'uniform_nodes': uniform.nodeCount(),
+                            'reduction': 1 - self.mesh.cellCount() / uniform.cellCount(),
+                            'refinement_steps': 0}
+        if rhomap is not None:
+            self.mesh_report['max_rhoa_error'] = float(self.__rhoa_error(rhomap)[1].max())
+            self.mesh_report['uniform_max_rhoa_error'] = float(
+                self.__rhoa_error(rhomap, uniform)[1].max())
+        pg.info(f"Adaptive mesh: {self.mesh.cellCount()} cells, uniform mesh: "
+                f"{uniform.cellCount()} cells ({self.mesh_report['reduction']:.0%} reduction)")
+        return self.mesh
 
-        self.mesh = mt.createMesh(self.geometry, quality=mesh_quality)
+    def __rhoa_error(self, rhomap, mesh=None):
+        """Estimate the relative error of the apparent resistivity simulated on the mesh.
+
+        The reference is the solution on the mesh refined once uniformly (createH2). Default
+        mesh is the mesh of the simulator.
+        """
+        mesh = self.mesh if mesh is None else mesh
+        # the data containers are kept, their arrays are freed with them
+        data = ert.simulate(mesh, scheme=self.scheme, res=rhomap, noiseLevel=0)
+        rhoa = np.array(data['rhoa'])
+        data_fine = ert.simulate(mesh.createH2(), scheme=self.scheme, res=rhomap, noiseLevel=0)
+        rhoa_fine = np.array(data_fine['rhoa'])
+        return rhoa, np.abs(rhoa - rhoa_fine) / np.abs(rhoa_fine)
+
+    @ins.instrumented()
+    def refine_mesh(self, rhomap, tolerance=0.01, max_steps=3, fraction=0.1):
+        """Refine the mesh where the forward solution is the least accurate.
+
+        At each step, the error of the apparent resistivity is estimated by comparing it with
+        the solution on a uniformly refined copy of the mesh. The error of each datum is
+        distributed to the cells with the normalized sensitivity (Jacobian), and the fraction
+        of cells with the largest contribution is refined. The refinement stops when the
+        largest relative error is below tolerance.
+
+        parameters
+        ----------
+        rhomap: resistivity of the regions, see plot_rhomap.
+        tolerance: the accepted relative error of the apparent resistivity (0.01 = 1%).
+        max_steps: the maximum number of refinements.
+        fraction: the fraction of cells refined at each step.
+        """
+        if isinstance(self.mesh, str):
+            raise ValueError("Run create_mesh or create_adaptive_mesh before refine_mesh")
+
+        step = 0
+        rhoa, error = self.__rhoa_error(rhomap)
+        while error.max() > tolerance and step < max_steps:
+            with ins.span('refinement_step', step=step + 1, **ins.mesh_info(self.mesh)):
+                res = np.array(pg.solver.parseMapToCellArray(rhomap, self.mesh))
+                # one region, so each cell is a parameter (in the order of the mesh cells)
+                cell_mesh = pg.Mesh(self.mesh)
+                cell_mesh.setCellMarkers(np.full(cell_mesh.cellCount(), 2))
+                fop = ert.ERTModelling()
+                fop.setData(self.scheme)
+                fop.setMesh(cell_mesh)
+                fop.createJacobian(pg.Vector(res))
+                # sensitivity of log(rhoa) to log(res) of each cell
+                sens = np.abs(pg.utils.gmat2numpy(fop.jacobian())) * res / rhoa[:, np.newaxis]
+                indicator = error @ sens
+
+                # add a node in the center of the cells with the largest error contribution
+                n_refine = max(1, int(fraction * self.mesh.cellCount()))
+                for ind in np.argsort(indicator)[-n_refine:]:
+                    self.geometry.createNode(self.mesh.cell(int(ind)).center())
+                self.mesh = mt.createMesh(self.geometry, quality=self.__mesh_quality)
+            step += 1
+            rhoa, error = self.__rhoa_error(rhomap)
+
+        if isinstance(self.mesh_report, str):
+            self.mesh_report = {}
+        self.mesh_report.update({'cells': self.mesh.cellCount(), 'nodes': self.mesh.nodeCount(),
+                                 'refinement_steps': self.mesh_report.get('refinement_steps', 0)
+                                 + step, 'max_rhoa_error': float(error.max()),
+                                 'mean_rhoa_error': float(error.mean())})
+        if 'uniform_cells' in self.mesh_report:
+            self.mesh_report['reduction'] = 1 - (self.mesh.cellCount()
+                                                 / self.mesh_report['uniform_cells'])
+        pg.info(f"Refined mesh: {self.mesh.cellCount()} cells after {step} step(s), "
+                f"maximum rhoa error {error.max():.2%}")
         return self.mesh
 
     def plot_rhomap(self, rhomap):
@@ -152,6 +348,7 @@ class RootSimulator:
         """Plot the subsurface with the created mesh"""
         return pg.show(self.mesh)
 
+    @ins.instrumented()
     def forward_model(self, rhomap):
         """Simulate the interpolation of the mesh, scheme and resistivity values.
 
@@ -160,25 +357,45 @@ class RootSimulator:
         rhomap: resistivity of the region. For simplicity, use the regional rhomap available,
                 if the individual points are not available.
         """
-        data = ert.simulate(self.mesh, scheme=self.scheme, res=rhomap, noiseLevel=1,
-                            noiseAbs=1e-6, seed=1337)
-        # remove the values below 0
-        data.remove(data['rhoa'] < 0)
+        with ins.span('simulate', **ins.mesh_info(self.mesh)) as stage:
+            data = ert.simulate(self.mesh, scheme=self.scheme, res=rhomap, noiseLevel=1,
+                                noiseAbs=1e-6, seed=1337)
+            # remove the values below 0
+            data.remove(data['rhoa'] < 0)
+            stage.set(data=data.size())
         # print out the confirmation of the minimum value
         pg.info('Filtered rhoa (min/max)', min(data['rhoa']), max(data['rhoa']))
         self.__inv_data = data
 
         return ert.show(data, label=pg.unit('res'))
 
-    def inversion2d(self, para_depth=30):
+    @ins.instrumented()
+    def inversion2d(self, para_depth=30, store=None, lam=20, criterion='lcurve'):
         """Create an inversion of the forward model to produce the feature and the layers.
 
         parameter
         ---------
         para_depth: the slice of the depth containing our feature
+        lam: the regularization strength. 'auto' selects it on the regular grid using
+             select_lambda (lambda_selection module), the curve data are saved in lambda_curve.
+        criterion: 'lcurve' or 'discrepancy', the selection criterion when lam is 'auto'.
+        store: ResultsStore (results_store module). If given, the inversion on the regular grid
+               is saved, and can be displayed with display_inverted_img without recomputing.
+               The identifier of the run is set in run_id.
         """
+        if lam == 'auto':
+            self.lambda_curve = ls.select_lambda(self.__inv_data, self.__regular_grid(),
+                                                 criterion=criterion)
+            lam = self.lambda_curve['lam']
+            pg.info(f"Selected lambda: {lam:.3g}")
+        self.__lam = lam
+
         self.__manager = ert.ERTManager(self.__inv_data)
-        self.__inversion = self.__manager.invert(lam=20, verbose=True, paraDepth=para_depth)
+        ins.watch_iterations(self.__manager.inv)
+        with ins.span('invert', data=self.__inv_data.size()) as stage:
+            self.__inversion = self.__manager.invert(lam=lam, verbose=True, paraDepth=para_depth)
+            stage.set(**ins.mesh_info(self.__manager.paraDomain))
+            ins.record_iterations(self.__manager.inv)
 
         # performs the inversion calculations and plots the inversion.
         self.__manager.showResultAndFit()
@@ -188,22 +405,46 @@ class RootSimulator:
         # perform regularization on the inverted profile
         __run_regularized = self.__perform_grid_regularization()
 
+        if store is not None:
+            inversion = self.__manager.inv
+            self.run_id = store.save(self.__manager.paraDomain, __run_regularized,
+                                     chi2=inversion.chi2(), response=inversion.response,
+                                     coverage=_coverage(self.__manager.fop),
+                                     name=f'synthetic {self.__sch}',
+                                     settings={'method': 'inversion2d', 'scheme': self.__sch,
+                                               'para_depth': para_depth, 'lam': self.__lam,
+                                               'mesh_quality': self.__mesh_quality,
+                                               'rhomap': self.__rhomap})
+
+    def __regular_grid(self):
+        """Create the regular grid of the inversion, with an appended boundary (marker 1)."""
+        return _regular_grid(self.__x_start, self.__x_stop, self.__layer[1])
+
     def __perform_grid_regularization(self):
         # creates a regular grid for the inversion.
-        x_pos = np.linspace(self.__x_start, self.__x_stop, 33)
-        y_pos = pg.cat([0], pg.utils.grange(0.5, self.__layer[1], n=5))
-
-        inversion_domain = pg.createGrid(x=x_pos, y=y_pos[::-1], marker=2)
-        grid = pg.meshtools.appendBoundary(inversion_domain, marker=1, xbound=50, ybound=50)
-        inversion_model = self.__manager.invert(self.__inv_data, mesh=grid, lam=20, verbose=True)
+        grid = self.__regular_grid()
+        with ins.span('grid_regularization', **ins.mesh_info(grid)):
+            inversion_model = self.__manager.invert(self.__inv_data, mesh=grid, lam=self.__lam,
+                                                    verbose=True)
+            ins.record_iterations(self.__manager.inv)
         __model_para_depth = self.__manager.paraModel(inversion_model)
         return __model_para_depth
 
-    def display_inverted_img(self):
-        """Display the inverted Image in a regular Mesh."""
+    def display_inverted_img(self, run=None):
+        """Display the inverted Image in a regular Mesh.
+
+        parameter
+        ---------
+        run: a run loaded from a ResultsStore (results_store module), displayed instead of the
+             last inversion.
+        """
         # plot the result of the inversion...
         _, axis = plt.subplots(1, 1)
-        self.__manager.showResult(ax=axis, cMin=25, hold=True, cMax=150)
+        if run is None:
+            self.__manager.showResult(ax=axis, cMin=25, hold=True, cMax=150)
+        else:
+            pg.show(run.mesh, np.asarray(run.model), ax=axis, hold=True, cMap="Spectral_r",
+                    logScale=True, cMin=25, cMax=150, label=pg.unit('res'))
         axis.set_title('Inversion regular grid')
 
     def __true_model(self):
@@ -247,6 +488,7 @@ class RootSimulator:
         fig.clear()
         clear_output(wait=True)
 
+    @ins.instrumented()
     def animate_simulation(self):
         """Animate the transitions of three model simulations.
 
@@ -298,103 +540,243 @@ class RootSimulator2:
 
     Parameter
     ----------
-    data - raw supersting file *.stg
+    data - raw supersting file *.stg, or a list of the files of a roll-along survey, merged
+           into one dataset using merge_surveys in the read_res_data module.
+    offsets - list of the x-offset of each file of a roll-along survey, if the positions of
+              the files are relative to the start of each line. Default is no offset.
 
     Functions
     ----------
     forward_model: Returns the model of the apparent resistivity across the profile.
+    quality_control: Removes the outliers and fits the error model of the data.
     inverse_model: Returns the true resistivity of the subsurface under investigation.
+    ip_simulation: Returns the chargeability of the subsurface, using the resistivity inversion.
     """
 
-    def __init__(self, data):
+    def __init__(self, data, offsets=None):
         """Input data should be in the .dat format.
 
         The .dat file can be obtained using the standardized_bert function in the read_res_data
         module."""
         self.data = data
+        self.offsets = offsets
         self.mesh = "Run generate_mesh"
         self.__data_tr = ''  # stores the read in data
         self.__sim = ''
         self.__tr_res = ''
+        self.__response = ''  # the response of the resistivity model, used by ip_simulation
+        self.__raw = ''  # stores the output of supersting_processing, parsed once
+        self.__qc = ''  # the settings of the quality control, if activated
+        self.qc_report = 'Run quality_control'
+        self.run_id = 'Run inverse_simulation with a ResultsStore'
+        self.lambda_curve = "Run inverse_simulation with lam='auto'"
+        self.ip_report = 'Run ip_simulation'
+        self.chargeability = 'Run ip_simulation'
 
     def __activate_data(self):
         """Activate variables for general use."""
         # Ensure the right data file is used for the class
-        if not os.path.isfile(self.data):
-            raise ValueError(f"{self.data} does not exist, make sure file is in the same directory")
-        if self.data[-4:] != '.stg':
-            raise ValueError(f"{self.data} is not a supersting file. Input a supersting file(.stg)")
+        for file in self.__files():
+            if not os.path.isfile(file):
+                raise ValueError(f"{file} does not exist, make sure file is in the same directory")
+            if file[-4:] != '.stg':
+                raise ValueError(f"{file} is not a supersting file. Input a supersting file(.stg)")
 
         # Updates the global variable to be used across boards
-        self.__data_tr = rrd.standardized_bert(self.data)
-        self.__data_tr["err"] = ert.estimateError(self.__data_tr, relativeError=0.02)
+        if isinstance(self.data, str):
+            self.__data_tr = rrd.standardized_bert(self.data)
+        else:
+            self.__data_tr = rrd.merge_surveys(self.data, offsets=self.offsets)
+        if self.__qc:
+            with ins.span('quality_control', data=self.__data_tr.size()) as stage:
+                self.qc_report = dqc.quality_control(self.__data_tr, **self.__qc)
+                stage.set(remaining=self.qc_report['remaining'])
+        else:
+            with ins.span('estimateError', data=self.__data_tr.size()):
+                self.__data_tr["err"] = ert.estimateError(self.__data_tr, relativeError=0.02)
         return self.__data_tr
 
-    def generate_mesh(self, boundary=200, depth=200, quality=34.5):
+    def __files(self):
+        """Return the list of the supersting files of the survey."""
+        return [self.data] if isinstance(self.data, str) else list(self.data)
+
+    def __raw_data(self):
+        """Return the output of supersting_processing of the files, merged as merge_surveys.
+
+        The offsets are added to the x-positions, and the readings of the same ABMN positions
+        recorded in several files (the overlap) are kept once, from the first file.
+        """
+        files = self.__files()
+        offsets = np.zeros(len(files)) if self.offsets is None else self.offsets
+        if len(offsets) != len(files):
+            raise ValueError("offsets must contain one value for each file")
+        raw = []
+        for file, offset in zip(files, offsets):
+            data = rrd.supersting_processing(file)
+            data[:, [2, 5, 8, 11]] += offset
+            raw.append(data)
+        raw = np.vstack(raw)
+        if len(files) > 1:
+            _, first = np.unique(np.round(raw[:, 2:14], 2), axis=0, return_index=True)
+            raw = raw[np.sort(first)]
+        return raw
+
+    def quality_control(self, max_error=0.1, decimate=False, relative_error=0.02):
+        """Activate the quality control of the data used by generate_mesh and inverse_simulation.
+
+        The normal/reciprocal and repeated readings are matched, the readings whose reciprocal
+        error exceeds max_error are removed, and the error of the data is fitted from the
+        reciprocal errors instead of the flat 2% relative error (see the data_qc module).
+
+        Parameters
+        ----------
+        max_error: the maximum relative reciprocal error of a reading.
+        decimate: boolean. To replace the repeated readings with their mean.
+        relative_error: the relative error used if the data have too few reciprocals.
+
+        return
+        ------
+        The report of the data reduction. inverse_simulation adds the measured
+        'inversion_time' and the 'extrapolated_time_without_reduction', an estimate of the
+        time of the inversion of all the readings (linear in the number of data), not a
+        measured time.
+        """
+        self.__qc = {'max_error': max_error, 'decimate': decimate,
+                     'relative_error': relative_error}
+        self.__activate_data()
+        report = self.qc_report
+        pg.info(f"Quality control: {report['remaining']} of {report['data']} readings kept "
+                f"({report['reduction']:.0%} reduction), error model: "
+                f"{report['absolute_error']:.3g} Ωm + {report['relative_error']:.2%}")
+        return report
+
+    @ins.instrumented()
+    def generate_mesh(self, boundary=2, depth=None, quality=34.5, para_dx=0.5,
+                      coverage=None, max_cell=10):
         """Generate the mesh for the inversion simulations.
 
+        The parameter domain is sized from the survey: unless given, its depth is the largest
+        depth of investigation of the measurements (survey_geometry.depth_of_investigation),
+        which depends on the electrode configuration and the length of each array, rounded up
+        to a multiple of the electrode spacing, and the size of its cells is limited relative
+        to the electrode spacing. Hence, short surveys get proportionally small meshes.
+
         Parameters
         ----------
         boundary: The extent of allowance of current flow during the inversion calculations
                   (Margin for parameter domain in absolute sensor distances).
         depth: The depth we want to investigate (The Maximum depth for parametric domain).
-        quality: Number of notes. High value creates more refined nodes. 34.5 is the maximum
+               Default (None) is the depth of investigation of the data.
+        quality: Number of notes. High value creates more refined nodes. 34.5 is the maximum.
+                 With the default depth, it is limited to 33.5: with the cell size limit,
+                 the mesh generator may not end above about 33.8.
+        para_dx: The size of the cells at the surface relative to the electrode spacing.
+        coverage: If given (e.g. 1e-3), the parameter domain is trimmed to the depth where the
+                  coverage (sum of the absolute sensitivities) of the cells drops below this
+                  fraction of its maximum.
+        max_cell: The maximum area of the cells of the parameter domain, in squared electrode
+                  spacings (0: not limited).
         """
         # activate the data
         self.__activate_data()
-        self.mesh = mt.createParaMesh(self.__data_tr.sensorPositions(), paraDX=0.5, paraDepth=200,
-                                      paraBoundary=boundary, boundary=depth, quality=quality)
+        spacing = sgeo.electrode_spacing(np.array(self.__data_tr.sensorPositions())[:, 0])
+        if depth is None:
+            doi = np.max(sgeo.depth_of_investigation(*sgeo.electrode_positions(self.__data_tr)))
+            depth = float(spacing * np.ceil(doi / spacing))
+            quality = min(quality, 33.5)
+        para_max_cell = max_cell * spacing ** 2
+        self.__create_para_mesh(boundary, depth, quality, para_dx, para_max_cell)
+
+        if coverage is not None:
+            trimmed_depth = float(spacing * np.ceil(self.__coverage_depth(coverage) / spacing))
+            if trimmed_depth < depth:
+                pg.info(f"Parameter domain trimmed from {depth:.2f} m to {trimmed_depth:.2f} m")
+                self.__create_para_mesh(boundary, trimmed_depth, quality, para_dx,
+                                        para_max_cell)
         return pg.show(self.mesh, markers=True)
 
-    def forward_model(self):
+    def __create_para_mesh(self, boundary, depth, quality, para_dx, para_max_cell):
+        """Create the inversion mesh with a parameter domain of the given depth."""
+        with ins.span('createParaMesh', sensors=self.__data_tr.sensorCount(),
+                      para_depth=depth) as stage:
+            self.mesh = mt.createParaMesh(self.__data_tr.sensorPositions(), paraDX=para_dx,
+                                          paraDepth=depth, paraBoundary=boundary,
+                                          paraMaxCellSize=para_max_cell, quality=quality)
+            stage.set(**ins.mesh_info(self.mesh))
+
+    def __coverage_depth(self, threshold):
+        """Return the depth of the deepest cell whose relative coverage exceeds the threshold.
+
+        The coverage is computed with the Jacobian of a homogeneous model (median rhoa).
+        """
+        with ins.span('coverage', **ins.mesh_info(self.mesh)):
+            fop = ert.ERTModelling(sr=False)
+            fop.setMesh(self.mesh)
+            fop.data = self.__data_tr
+            fop.setRegionProperties(1, background=True)
+            n_para = fop.regionManager().parameterCount()
+            fop.createJacobian(pg.Vector(n_para, float(np.median(self.__data_tr['rhoa']))))
+
+            cover = _coverage(fop)
+            depths = -np.array(fop.paraDomain.cellCenters())[:, 1]
+        covered = cover >= threshold * cover.max()
+        return float(depths[covered].max())
+
+    @ins.instrumented()
+    def forward_model(self, bins=(100, 40), agg='median', log_scale=False):
         """Plots the apparent resistivity based on the x-position and Depth of Investigation.
 
         Visualizing the subsurface to filter outliers are a necessity to obtaining an optimal
         inversion results. Hence, the forward_model helps visualize the data and recognize the
         general distribution of the resistivity of the subsurface.
-        """
-        file = rrd.supersting_processing(self.data)
-        # Get the midpoint with the resistivity value and plot estimation
-        data = file[file[:, 1] > 0] # scale data to remove negative resistivity (anomalous data)
-
-        # create dictionary to store position and depth of each electrode configuration
-        data_bank = {}
-
-        # Get the rows containing Wenner array based on the configuration arrangement
-        wen_arr = data[data[:, 5] > data[:, 2]]
 
-        # midpoint of the mn electrode >> (n-m/2) + m for wenner array
-        # the addition of m is to maintain the exact location of the midpoint.
-        x_pos_wa = ((wen_arr[:, 11] - wen_arr[:, 8]) / 2) + wen_arr[:, 8]
-        depth_wa = 0.2 * (wen_arr[:, 5] - wen_arr[:, 2])  # 0.2*AB
+        One pseudosection is plotted for each electrode configuration in the data. The readings
+        are aggregated in a grid of bins rendered as one image (see the pseudosection module),
+        so large or merged datasets are plotted as fast as small ones.
 
-        # update dictionary
-        data_bank['Wenner Array'] = [x_pos_wa, depth_wa, wen_arr]
-
-        # Get the rows containing dipole-dipole based on the configuration arrangement
-        dip_dip = data[data[:, 5] < data[:, 2]]
-
-        x_pos_dd = ((dip_dip[:, 5] - dip_dip[:, 8]) / 2) + dip_dip[:, 8]  # dip_dip ~ BA
-        depth_dd = abs(0.2 * (dip_dip[:, 2] - dip_dip[:, 11]))  # 0.2*BN
-        # update dictionary
-        data_bank['Dipole-Dipole'] = [x_pos_dd, depth_dd, dip_dip]
-
-        # Plot the two electrode configuration models
-        for arr_name, values in data_bank.items():
+        Parameters
+        ----------
+        bins: number of bins along the distance and the depth.
+        agg: 'median' or 'mean' of the readings within each bin.
+        log_scale: use a logarithmic color scale.
+        """
+        if isinstance(self.__raw, str):
+            self.__raw = self.__raw_data()
+        # scale data to remove negative resistivity (anomalous data)
+        data = self.__raw[self.__raw[:, 1] > 0]
+
+        # x-position of the A, B, M, N electrodes
+        abmn = data[:, 2], data[:, 5], data[:, 8], data[:, 11]
+        x_pos, depth = ps.pseudo_positions(*abmn)
+        arrays = sgeo.classify_arrays(*abmn)
+
+        # Plot the models of each electrode configuration
+        for array in np.unique(arrays):
+            select = arrays == array
             fig, axis = plt.subplots(figsize=(10, 7))
-            info = axis.scatter(values[0], values[1], s=75, c=values[2][:, 1])
-            axis.set_xlabel('Distance (m)')
-            axis.xaxis.tick_top()
-            axis.xaxis.set_label_position('top')
-            axis.set_ylabel('Depth (m)')
-            axis.invert_yaxis()  # Transforms the data to start from depth 0 - 25 meters
-            axis.set_title(arr_name, fontweight='bold')
+            _, info = ps.show_pseudosection(x_pos[select], depth[select], data[select, 1],
+                                            bins=bins, agg=agg, ax=axis, log_scale=log_scale)
+            axis.set_title(sgeo.ARRAY_NAMES[array], fontweight='bold')
             fig.colorbar(info, orientation='horizontal', label='Res (Ωm)')
 
-    def inverse_simulation(self):
-        """Inversion Modeling of the Resistivity Data."""
+    @ins.instrumented()
+    def inverse_simulation(self, store=None, lam=20, criterion='lcurve',
+                           lambda_workers=ls.DEFAULT_WORKERS):
+        """Inversion Modeling of the Resistivity Data.
+
+        parameter
+        ---------
+        store: ResultsStore (results_store module). If given, the mesh, model, response,
+               coverage, chi² and settings are saved, and can be plotted with plot_inverse
+               without recomputing. The identifier of the run is set in run_id.
+        lam: the regularization strength. 'auto' selects it using select_lambda
+             (lambda_selection module), the curve data are saved in lambda_curve, and the
+             model of the selected lambda is kept (it is not inverted again).
+        criterion: 'lcurve' or 'discrepancy', the selection criterion when lam is 'auto'.
+        lambda_workers: the number of processes of select_lambda when lam is 'auto'.
+        """
         print("Creating regions....")
-        simulate = ert.ERTModelling(sr=False)
+        simulate = _ERTModelling(sr=False)
         simulate.setMesh(self.mesh)
         simulate.data = self.__activate_data()
         simulate.setRegionProperties(1, background=True)
@@ -406,20 +788,107 @@ class RootSimulator2:
         calc_inversion = pg.Inversion(fop=simulate, verbose=True)
         calc_inversion.transData = trans_log
         calc_inversion.transModel = trans_log
-
-        true_resistivity = calc_inversion.run(self.__data_tr['rhoa'], self.__data_tr['err'], lam=20)
+        ins.watch_iterations(calc_inversion)
+
+        start = time.perf_counter()
+        selected = {}
+        if lam == 'auto':
+            self.lambda_curve = ls.select_lambda(self.__data_tr, self.mesh, criterion=criterion,
+                                                 workers=lambda_workers)
+            lam = self.lambda_curve['lam']
+            # the inversion only sets up the selected model (no iteration)
+            selected = {'startModel': self.lambda_curve['model'], 'maxIter': 0}
+            print(f"Selected lambda: {lam:.3g}")
+
+        with ins.span('inversion', data=self.__data_tr.size(), **ins.mesh_info(self.mesh)):
+            true_resistivity = calc_inversion.run(self.__data_tr['rhoa'], self.__data_tr['err'],
+                                                  lam=lam, **selected)
+            if selected:
+                # the Jacobian of the model, for the coverage and ip_simulation
+                simulate.createJacobian(true_resistivity)
+            ins.record_iterations(calc_inversion)
         self.__tr_res = true_resistivity
+        self.__response = np.array(calc_inversion.response)
+        if self.__qc:
+            # the time of an inversion grows linearly with the number of data (Jacobian size)
+            elapsed = time.perf_counter() - start
+            self.qc_report['inversion_time'] = elapsed
+            self.qc_report['extrapolated_time_without_reduction'] = elapsed * (
+                self.qc_report['data'] / max(self.qc_report['remaining'], 1))
+
+        if store is not None:
+            self.run_id = store.save(simulate.paraDomain, true_resistivity,
+                                     chi2=calc_inversion.chi2(), response=calc_inversion.response,
+                                     coverage=_coverage(simulate), data_files=self.__files(),
+                                     name=', '.join(os.path.basename(file)
+                                                    for file in self.__files()),
+                                     settings={'method': 'inverse_simulation', 'lam': lam,
+                                               'quality_control': self.__qc or None,
+                                               **ins.mesh_info(self.mesh)})
 
         return pg.show(simulate.paraDomain, true_resistivity, colorBar=True, cMap="Spectral_r",
                        cMin=8, cMax=1500, label=pg.unit('res'))
 
-    def plot_inverse(self, min_res=8, max_res=1500):
+    @ins.instrumented()
+    def ip_simulation(self, lam=20, max_misfit=0.1, delay=ipp.IP_DELAY, window=ipp.IP_WINDOW,
+                      ip_error=0.05, store=None):
+        """Inversion Modeling of the Chargeability (IP) Data.
+
+        The IP decays of all the readings are fitted at once, the bad decays are rejected and
+        the integral chargeability is recomputed (see the ip_processing module). The
+        chargeability is inverted on the mesh of the last inverse_simulation, with its
+        Jacobian, so no forward computation is needed.
+
+        parameter
+        ---------
+        lam: the regularization strength of the chargeability inversion.
+        max_misfit: the maximum misfit (rms of the log residuals) of a valid decay.
+        delay: the delay (s) between the current shut-off and the first IP window.
+        window: the length (s) of each IP window.
+        ip_error: the relative error of the integral chargeability (with a 0.1 msec floor).
+        store: ResultsStore (results_store module). If given, the chargeability is saved and
+               its run_id is added to ip_report.
+        """
+        if isinstance(self.__sim, str):
+            raise ValueError("Run inverse_simulation before ip_simulation")
+        with ins.span('process_ip', data=self.__data_tr.size()) as stage:
+            valid, self.ip_report = ipp.process_ip(self.__data_tr, delay=delay, window=window,
+                                                   max_misfit=max_misfit)
+            stage.set(rejected=self.ip_report['rejected'])
+
+        charge = np.array(self.__data_tr['ip'])
+        with ins.span('ip_inversion', data=int(valid.sum()), **ins.mesh_info(self.mesh)):
+            sens = ipp.sensitivity(pg.utils.gmat2numpy(self.__sim.jacobian()), self.__tr_res,
+                                   self.__response)
+            constraints = pg.utils.sparseMatrix2Array(self.__sim.constraints(), indices=True,
+                                                      getInCRS=False)
+            self.chargeability, response = ipp.invert_chargeability(
+                sens, charge, ip_error * np.abs(charge) + 0.1, constraints, lam=lam, valid=valid)
+        self.ip_report['rms'] = float(np.sqrt(np.mean((response - charge)[valid] ** 2)))
+
+        if store is not None:
+            self.ip_report['run_id'] = store.save(
+                self.__sim.paraDomain, self.chargeability, response=response,
+                data_files=self.__files(),
+                name=', '.join(os.path.basename(file) for file in self.__files()),
+                settings={'method': 'ip_simulation', 'lam': lam, 'max_misfit': max_misfit,
+                          'resistivity_run': self.run_id, **ins.mesh_info(self.mesh)})
+
+        return pg.show(self.__sim.paraDomain, self.chargeability, colorBar=True, cMap="viridis",
+                       label='Chargeability (msec)')
+
+    def plot_inverse(self, min_res=8, max_res=1500, run=None):
         """print and edit the inverse_simulation Image.
 
         parameters
         ---------
         min_res: The lowest resistivity values based on the simulation
         max_res: The highest resistivity values based on the simulation
+        run: a run loaded from a ResultsStore (results_store module), plotted instead of the
+             last inverse_simulation.
         """
+        if run is not None:
+            return pg.show(run.mesh, np.asarray(run.model), colorBar=True, cMap="Spectral_r",
+                           cMin=min_res, cMax=max_res, label=pg.unit('res'))
         return pg.show(self.__sim.paraDomain, self.__tr_res, colorBar=True, cMap="Spectral_r",
                        cMin=min_res, cMax=max_res, label=pg.unit('res'))
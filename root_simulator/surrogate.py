@@ -0,0 +1,442 @@
+"""The surrogate module emulates the RootSimulator to screen many root geometries quickly.
+
+A surrogate is trained on an ensemble of full finite element (FE) runs of the RootSimulator
+(create_geom, create_mesh and the forward model, optionally the inversion on the regular grid)
+sharing the world, the layer and the electrode scheme. Each run is described by a vector of
+parameters: the (x, y) nodes of the feature and the logarithm of the resistivity of each
+region. The logarithm of the apparent resistivity (and of the inverted section) is reduced to a
+few principal components (PCA), and the components are predicted from the parameters by a
+polynomial ridge regression. A prediction is a matrix product, i.e. it takes milliseconds.
+
+The error of the surrogate is estimated by leave-one-out cross validation (closed form for the
+ridge regression) plus the variance lost by the truncation of the PCA, and scaled for each query
+by its leverage (the queries far from the training runs have a larger error). A query outside of the
+trained domain (parameters out of the training bounds or far from every training run) or with
+a too large estimated error falls back to the full FE computation.
+
+Dependence: numpy (pygimli and root_simulator to train the surrogate and for the fallback)
+
+Example
+-------
+    surrogate = RootSurrogate([50, -50], -50, [-1, -20], scheme_name='dd')
+    features = perturb_feature([(-10, -1), (17, -8), (5, -1)], [50, -50], [-1, -20], num=80)
+    rhomaps = [[[1, 100], [2, 75], [3, 50], [4, rho]] for rho in np.linspace(100, 300, 80)]
+    surrogate.fit(features, rhomaps)
+    result = surrogate.predict([(-8, -1), (15, -9), (5, -1)],
+                               [[1, 100], [2, 75], [3, 50], [4, 220]])
+"""
+import numpy as np
+import instrumentation as ins
+
+
+def polynomial_features(params, degree=2):
+    """Return the monomials of the parameters up to the degree (1, x_i, x_i x_j, ...)."""
+    params = np.atleast_2d(np.asarray(params, dtype=float))
+    columns = [np.ones(len(params))]
+    terms = [()]
+    for _ in range(degree):
+        # extend the terms of the last degree with the parameters of larger or equal index
+        terms = [term + (ind,) for term in terms
+                 for ind in range(term[-1] if term else 0, params.shape[1])]
+        columns.extend(np.prod(params[:, list(term)], axis=1) for term in terms)
+    return np.column_stack(columns)
+
+
+class ReducedBasisRegression:
+    """PCA of the outputs and polynomial ridge regression of the principal components.
+
+    Parameters
+    ----------
+    variance: the fraction of the variance of the outputs kept by the principal components.
+    degree: the degree of the polynomial regression.
+    alpha: the ridge regularization of the regression.
+
+    Attributes
+    ----------
+    error: the estimated (leave-one-out) root mean square error of each output, averaged over
+           the training samples (see error_at for the error of a query).
+    components: the number of principal components kept.
+    """
+
+    def __init__(self, variance=0.999, degree=2, alpha=1e-6):
+        """Set the settings of the regression."""
+        self.variance = variance
+        self.degree = degree
+        self.alpha = alpha
+        self.error = 'Run fit'
+        self.components = 'Run fit'
+        self.__fit = {}
+
+    def __scaled(self, params):
+        """Return the parameters scaled by the mean and the standard deviation of the training."""
+        return (np.atleast_2d(np.asarray(params, dtype=float)) - self.__fit['x_mean']) \
+            / self.__fit['x_std']
+
+    def fit(self, params, outputs):
+        """Fit the regression of the outputs (samples, outputs) on the params (samples, params)."""
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        outputs = np.atleast_2d(np.asarray(outputs, dtype=float))
+        n_terms = polynomial_features(params[:1], self.degree).shape[1]
+        if len(params) <= n_terms:
+            raise ValueError(f"At least {n_terms + 1} samples are needed for a degree "
+                             f"{self.degree} regression, use more samples or a lower degree")
+
+        x_std = params.std(axis=0)
+        self.__fit = {'x_mean': params.mean(axis=0), 'x_std': np.where(x_std > 0, x_std, 1.0),
+                      'y_mean': outputs.mean(axis=0)}
+        scaled = self.__scaled(params)
+        self.__fit['bounds'] = scaled.min(axis=0), scaled.max(axis=0)
+        # the largest distance of a training sample to its nearest neighbour
+        dist = np.linalg.norm(scaled[:, None, :] - scaled[None, :, :], axis=2)
+        np.fill_diagonal(dist, np.inf)
+        self.__fit['spacing'] = float(dist.min(axis=1).max())
+        self.__fit['scaled'] = scaled
+
+        # principal components of the outputs
+        centered = outputs - self.__fit['y_mean']
+        _, singular, basis = np.linalg.svd(centered, full_matrices=False)
+        energy = np.cumsum(singular ** 2) / max(np.sum(singular ** 2), 1e-300)
+        self.components = int(min(np.searchsorted(energy, self.variance) + 1, len(singular)))
+        basis = basis[:self.components]
+        coefficients = centered @ basis.T
+
+        # ridge regression of the components, with the leverage for the leave-one-out error
+        poly = polynomial_features(scaled, self.degree)
+        normal = poly.T @ poly + self.alpha * np.eye(poly.shape[1])
+        weights = np.linalg.solve(normal, poly.T @ coefficients)
+        normal_inv = np.linalg.inv(normal)
+        leverage = np.sum(poly @ normal_inv * poly, axis=1)
+        loo_factor = 1 / np.maximum(1 - leverage, 1e-6)
+        loo = (coefficients - poly @ weights) * loo_factor[:, None]
+        truncation = centered - coefficients @ basis
+        self.error = np.sqrt(np.mean((loo @ basis + truncation) ** 2, axis=0))
+        self.__fit.update(basis=basis, weights=weights, normal_inv=normal_inv,
+                          loo_variance=np.mean(loo_factor))
+        return self
+
+    def predict(self, params):
+        """Return the predicted outputs (queries, outputs) of the params."""
+        if not self.__fit:
+            raise ValueError("Run fit before predict")
+        poly = polynomial_features(self.__scaled(params), self.degree)
+        return self.__fit['y_mean'] + poly @ self.__fit['weights'] @ self.__fit['basis']
+
+    def error_at(self, params):
+        """Return the estimated error (queries, outputs) of the predictions of the params.
+
+        The variance of the prediction error grows with the leverage h of the query as
+        1 + h, while the leave-one-out error averages 1 / (1 - h_i) over the training samples:
+        the error is scaled by the square root of their ratio.
+        """
+        if not self.__fit:
+            raise ValueError("Run fit before error_at")
+        poly = polynomial_features(self.__scaled(params), self.degree)
+        leverage = np.sum(poly @ self.__fit['normal_inv'] * poly, axis=1)
+        scale = np.sqrt((1 + leverage) / self.__fit['loo_variance'])
+        return scale[:, None] * self.error[None, :]
+
+    def in_domain(self, params, margin=0.05, distance=1.5):
+        """Return True for the params within the trained domain.
+
+        The params must be within the bounds of the training samples (extended by margin times
+        their range), and closer to a training sample than distance times the largest distance
+        between a training sample and its nearest neighbour.
+        """
+        if not self.__fit:
+            raise ValueError("Run fit before in_domain")
+        scaled = self.__scaled(params)
+        low, high = self.__fit['bounds']
+        extent = margin * (high - low)
+        inside = np.all((scaled >= low - extent) & (scaled <= high + extent), axis=1)
+        nearest = np.linalg.norm(scaled[:, None, :] - self.__fit['scaled'][None, :, :],
+                                 axis=2).min(axis=1)
+        return inside & (nearest <= distance * self.__fit['spacing'])
+
+    def state(self):
+        """Return the fitted arrays, to save the regression."""
+        return dict(self.__fit, error=self.error)
+
+    def set_state(self, state):
+        """Set the fitted arrays saved with state."""
+        state = dict(state)
+        self.error = state.pop('error')
+        self.components = len(state['basis'])
+        self.__fit = state
+        return self
+
+
+def self_intersecting(polygons):
+    """Return True for the closed polygons (polygons, nodes, 2) whose edges cross each other."""
+    polygons = np.asarray(polygons, dtype=float)
+    if polygons.ndim == 2:
+        polygons = polygons[None]
+    start, end = polygons, np.roll(polygons, -1, axis=1)
+    n_nodes = polygons.shape[1]
+    # the pairs of edges without a common node
+    first, second = np.triu_indices(n_nodes, 2)
+    keep = ~((first == 0) & (second == n_nodes - 1))
+    first, second = first[keep], second[keep]
+
+    def orientation(p_a, p_b, p_c):
+        return np.sign((p_b[..., 0] - p_a[..., 0]) * (p_c[..., 1] - p_a[..., 1])
+                       - (p_b[..., 1] - p_a[..., 1]) * (p_c[..., 0] - p_a[..., 0]))
+
+    a_1, a_2 = start[:, first], end[:, first]
+    b_1, b_2 = start[:, second], end[:, second]
+    cross = (orientation(a_1, a_2, b_1) * orientation(a_1, a_2, b_2) < 0) \
+        & (orientation(b_1, b_2, a_1) * orientation(b_1, b_2, a_2) < 0)
+    return cross.any(axis=1)
+
+
+def perturb_feature(feature, x_ext, layer, num=50, scale=2.0, seed=1337, max_draws=100):
+    """Return num random perturbations of the nodes of the feature, valid for create_geom.
+
+    The nodes are kept within the layer and 20 m away from the lateral boundaries of the
+    world (as required by RootSimulator.create_geom), and the self-intersecting features are
+    drawn again.
+
+    Parameters
+    ----------
+    feature: the (x, y) nodes of the feature, see RootSimulator.create_geom.
+    x_ext: the lateral extent of the world [end, start].
+    layer: the depth extent of the layer [start, end] containing the feature.
+    num: the number of features.
+    scale: the standard deviation (m) of the displacement of the nodes.
+    seed: the seed of the random displacements.
+    max_draws: the maximum number of draws of a feature.
+    """
+    rng = np.random.default_rng(seed)
+    nodes = np.asarray(feature, dtype=float)
+    maxx, minx = x_ext
+    if maxx - minx <= 40:
+        raise ValueError("The lateral extent must be larger than 40 m")
+
+    def draw(count):
+        moved = nodes[None, :, :] + rng.normal(0, scale, (count,) + nodes.shape)
+        moved[:, :, 0] = np.clip(moved[:, :, 0], minx + 20, maxx - 20)
+        moved[:, :, 1] = np.clip(moved[:, :, 1], layer[1], layer[0])
+        return moved
+
+    moved = draw(num)
+    for _ in range(max_draws):
+        invalid = self_intersecting(moved)
+        if not invalid.any():
+            break
+        moved[invalid] = draw(int(invalid.sum()))
+    else:
+        raise ValueError(f"{int(invalid.sum())} features still intersect themselves after "
+                         f"{max_draws} draws, use a smaller scale")
+    return [[tuple(node) for node in sample] for sample in moved.tolist()]
+
+
+class RootSurrogate:
+    """Emulate the forward model (and the inversion) of the RootSimulator.
+
+    The world, the layer and the electrode scheme are fixed, the feature (same number of nodes)
+    and the resistivity of the regions vary between the runs.
+
+    Parameters
+    ----------
+    x_ext, y_ext, layer: the world of the geometries, see RootSimulator.create_geom.
+    scheme_name, start, end, num, mesh_quality: the electrode scheme and the mesh quality, see
+                                               RootSimulator.create_mesh.
+    variance, degree, alpha: the settings of the ReducedBasisRegression.
+
+    Functions
+    ----------
+    simulate: runs the full FE forward model (and inversion) of one geometry.
+    fit: trains the surrogate on an ensemble of geometries.
+    predict: predicts the apparent resistivity (and the inverted section) of a geometry, with
+             the fallback to the full FE computation.
+    save, load: writes and reads a trained surrogate (.npz).
+    """
+
+    def __init__(self, x_ext, y_ext, layer, scheme_name='dd', start=-30, end=30, num=21,
+                 mesh_quality=34, variance=0.999, degree=2, alpha=1e-6):
+        """Set the world, the electrode scheme and the settings of the regression."""
+        self.settings = {'x_ext': list(x_ext), 'y_ext': y_ext, 'layer': list(layer),
+                         'scheme_name': scheme_name, 'start': start, 'end': end, 'num': num,
+                         'mesh_quality': mesh_quality}
+        self.data_model = ReducedBasisRegression(variance, degree, alpha)
+        self.section_model = None
+        self.section_mesh = 'Run fit with sections=True'
+        self.fit_report = 'Run fit'
+        self.__n_nodes = None
+
+    def parameters(self, feature, rhomap):
+        """Return the parameter vector: the feature nodes and log10 of the regions' resistivity."""
+        nodes = np.asarray(feature, dtype=float)
+        if self.__n_nodes is not None and len(nodes) != self.__n_nodes:
+            raise ValueError(f"The feature must have {self.__n_nodes} nodes as the training "
+                             "features")
+        regions = sorted(rhomap, key=lambda region: region[0])
+        return np.concatenate((nodes.ravel(), np.log10([region[1] for region in regions])))
+
+    def __grid(self):
+        """Create the regular grid of the inversion shared by all the sections."""
+        from root_simulator import _regular_grid
+
+        return _regular_grid(self.settings['start'], self.settings['end'],
+                             self.settings['layer'][1])
+
+    def simulate(self, feature, rhomap, section=False, lam=20):
+        """Run the full FE forward model (noise free) and optionally the inversion.
+
+        return
+        ------
+        The apparent resistivity and, if section, the inverted resistivity of the cells of the
+        regular grid (section_mesh).
+        """
+        # pygimli is only needed for the full FE computations
+        from pygimli.physics import ert
+        from root_simulator import RootSimulator
+
+        settings = self.settings
+        simulator = RootSimulator()
+        simulator.create_geom(settings['x_ext'], settings['y_ext'], settings['layer'], feature)
+        simulator.create_mesh(settings['scheme_name'], start=settings['start'],
+                              end=settings['end'], num=settings['num'],
+                              mesh_quality=settings['mesh_quality'])
+        data = ert.simulate(simulator.mesh, scheme=simulator.scheme, res=rhomap, noiseLevel=0)
+        # the noise free rhoa can be slightly negative from the numerical error
+        rhoa = np.abs(np.array(data['rhoa']))
+        if not section:
+            return rhoa, None
+
+        data['err'] = np.full(data.size(), 0.02)
+        manager = ert.ERTManager(data)
+        model = manager.invert(data, mesh=self.__grid(), lam=lam, verbose=False)
+        self.section_mesh = manager.paraDomain
+        return rhoa, np.array(manager.paraModel(model))
+
+    def fit(self, features, rhomaps, sections=False, lam=20):
+        """Train the surrogate with the full FE runs of the geometries.
+
+        Parameters
+        ----------
+        features: list of features (same number of nodes), see perturb_feature.
+        rhomaps: list of rhomaps (same regions), one per feature.
+        sections: boolean. To also emulate the inversion on the regular grid (much longer
+                  training, one inversion per geometry).
+        lam: the regularization strength of the inversions.
+
+        return
+        ------
+        The report of the training: number of runs, components and estimated errors. The runs
+        whose FE computation failed are skipped and reported in 'failed_runs' (index and error).
+        """
+        if len(features) != len(rhomaps):
+            raise ValueError("features and rhomaps must have the same length")
+        self.__n_nodes = None
+        params, rhoas, models = [], [], []
+        with ins.span('surrogate_training', runs=len(features), sections=sections) as stage:
+            failed = []
+            for index, (feature, rhomap) in enumerate(zip(features, rhomaps)):
+                try:
+                    rhoa, model = self.simulate(feature, rhomap, section=sections, lam=lam)
+                except Exception as error:  # pylint: disable=broad-except
+                    failed.append({'index': index, 'error': repr(error)})
+                    ins.record('surrogate_failed_run', index=index, error=repr(error))
+                    continue
+                params.append(self.parameters(feature, rhomap))
+                rhoas.append(np.log10(rhoa))
+                models.append(model)
+            if not params:
+                raise ValueError(f"All the FE runs failed, the first with {failed[0]['error']}")
+
+            self.data_model.fit(params, rhoas)
+            self.section_model = None
+            if sections:
+                self.section_model = ReducedBasisRegression(
+                    self.data_model.variance, self.data_model.degree, self.data_model.alpha)
+                self.section_model.fit(params, np.log10(models))
+            self.__n_nodes = len(features[0])
+
+            # the errors are in log10, converted to relative errors
+            self.fit_report = {
+                'runs': len(params), 'failed_runs': failed,
+                'components': self.data_model.components,
+                'rhoa_error': float(10 ** np.sqrt(np.mean(self.data_model.error ** 2)) - 1)}
+            if sections:
+                self.fit_report['section_components'] = self.section_model.components
+                self.fit_report['section_error'] = float(
+                    10 ** np.sqrt(np.mean(self.section_model.error ** 2)) - 1)
+            stage.set(**dict(self.fit_report, failed_runs=len(failed)))
+        return self.fit_report
+
+    def predict(self, feature, rhomap, section=False, max_error=0.05, fallback=True, lam=20):
+        """Predict the apparent resistivity (and the inverted section) of a geometry.
+
+        Parameters
+        ----------
+        feature, rhomap: the geometry, see RootSimulator.create_geom and plot_rhomap.
+        section: boolean. To predict the inverted section (the surrogate must be trained with
+                 sections=True).
+        max_error: the maximum estimated relative error (rms) of the surrogate.
+        fallback: boolean. To run the full FE computation when the geometry is out of the
+                  trained domain or the estimated error exceeds max_error.
+        lam: the regularization strength of the fallback inversion.
+
+        return
+        ------
+        A dictionary with the 'rhoa', its estimated relative 'error' for each reading (the
+        error of the training scaled by the leverage of the geometry, see error_at), the
+        'section' (or None), 'in_domain' and the 'source' ('surrogate' or 'fe').
+        """
+        if section and self.section_model is None:
+            raise ValueError("The surrogate was not trained with sections=True")
+        params = self.parameters(feature, rhomap)
+        in_domain = bool(self.data_model.in_domain(params)[0])
+        error = 10 ** self.data_model.error_at(params)[0] - 1
+        estimated = np.sqrt(np.mean(error ** 2))
+        if section:
+            section_error = 10 ** self.section_model.error_at(params)[0] - 1
+            estimated = max(estimated, np.sqrt(np.mean(section_error ** 2)))
+
+        if fallback and (not in_domain or estimated > max_error):
+            with ins.span('surrogate_fallback', in_domain=in_domain):
+                rhoa, model = self.simulate(feature, rhomap, section=section, lam=lam)
+            return {'rhoa': rhoa, 'error': np.zeros_like(rhoa), 'section': model,
+                    'in_domain': in_domain, 'source': 'fe'}
+
+        with ins.span('surrogate_prediction'):
+            rhoa = 10 ** self.data_model.predict(params)[0]
+            model = 10 ** self.section_model.predict(params)[0] if section else None
+        return {'rhoa': rhoa, 'error': error, 'section': model, 'in_domain': in_domain,
+                'source': 'surrogate'}
+
+    def save(self, file):
+        """Save the trained surrogate in a .npz file (the section mesh in a .bms file)."""
+        if file[-4:] != '.npz':
+            raise ValueError(f"{file} is not a .npz file name")
+        arrays = {f'data_{key}': value for key, value in self.data_model.state().items()}
+        if self.section_model is not None:
+            arrays.update({f'section_{key}': value
+                           for key, value in self.section_model.state().items()})
+            self.section_mesh.save(f'{file[:-4]}.bms')
+        np.savez(file, settings=np.array(repr(self.settings)),
+                 regression=np.array([self.data_model.variance, self.data_model.degree,
+                                      self.data_model.alpha]),
+                 report=np.array(repr(self.fit_report)), n_nodes=self.__n_nodes, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """Load a surrogate saved with save."""
+        import ast
+
+        saved = np.load(file)
+        variance, degree, alpha = saved['regression']
+        surrogate = cls(**ast.literal_eval(str(saved['settings'])), variance=variance,
+                        degree=int(degree), alpha=alpha)
+        surrogate.fit_report = ast.literal_eval(str(saved['report']))
+        surrogate.data_model.set_state({key[5:]: saved[key] for key in saved.files
+                                        if key.startswith('data_')})
+        if any(key.startswith('section_') for key in saved.files):
+            import pygimli as pg
+
+            surrogate.section_model = ReducedBasisRegression(variance, int(degree), alpha)
+            surrogate.section_model.set_state({key[8:]: saved[key] for key in saved.files
+                                               if key.startswith('section_')})
+            surrogate.section_mesh = pg.load(f'{file[:-4]}.bms')
+        surrogate.__n_nodes = int(saved['n_nodes'])
+        return surrogate
@@ -0,0 +1,99 @@
+"""The survey_geometry module computes the geometry of the measurements of a survey.
+
+The functions return, for all the measurements at once, the positions of the ABMN electrodes,
+the electrode configuration (array type), the electrode spacing and the depth of
+investigation, used to size the inversion meshes and to plot the pseudosections.
+
+Dependence: numpy
+"""
+import numpy as np
+
+# Median depth of investigation relative to the total length of the array (Edwards, 1977),
+# as tabulated by Loke (2004). The dipole-dipole factor depends on the dipole separation n.
+DOI_FACTORS = {'wa': 0.173, 'wb': 0.139, 'slm': 0.190, 'pp': 0.867, 'other': 0.200}
+DD_DOI_FACTORS = ([1, 2, 3, 4, 5, 6], [0.139, 0.174, 0.192, 0.203, 0.211, 0.216])
+
+ARRAY_NAMES = {'wa': 'Wenner Alpha', 'wb': 'Wenner Beta', 'slm': 'Schlumberger',
+               'dd': 'Dipole-Dipole', 'pp': 'Pole-Pole', 'other': 'Other'}
+
+
+def electrode_positions(data):
+    """Return the x-positions of the A, B, M, N electrodes of each measurement.
+
+    Parameters
+    ----------
+    data: DataContainerERT (e.g. the output of standardized_bert).
+
+    A missing electrode (pole arrays, index -1) takes the position of its partner electrode.
+    """
+    sensors = np.array(data.sensorPositions())[:, 0]
+    index = [np.array(data[token], dtype=int) for token in ['a', 'b', 'm', 'n']]
+    # a missing B (N) electrode is replaced by A (M), so the dipole has no length
+    index[1] = np.where(index[1] < 0, index[0], index[1])
+    index[3] = np.where(index[3] < 0, index[2], index[3])
+    return tuple(sensors[ind] for ind in index)
+
+
+def electrode_spacing(positions):
+    """Return the (median) spacing between neighbouring electrodes."""
+    positions = np.unique(np.round(np.asarray(positions, dtype=float), 6))
+    gaps = np.diff(positions)
+    gaps = gaps[gaps > 0]
+    if len(gaps) == 0:
+        raise ValueError("At least two electrodes at different positions are needed")
+    return float(np.median(gaps))
+
+
+def classify_arrays(a_pos, b_pos, m_pos, n_pos, tol=1e-6):
+    """Return the electrode configuration code of each measurement.
+
+    The codes are 'wa' (Wenner Alpha), 'wb' (Wenner Beta), 'slm' (Schlumberger), 'dd'
+    (Dipole-Dipole), 'pp' (Pole-Pole) and 'other'. The configurations are recognized whatever
+    the direction of the array (A left or right of B).
+    """
+    a_pos, b_pos, m_pos, n_pos = (np.asarray(pos, dtype=float)
+                                  for pos in (a_pos, b_pos, m_pos, n_pos))
+    ab_min, ab_max = np.minimum(a_pos, b_pos), np.maximum(a_pos, b_pos)
+    mn_min, mn_max = np.minimum(m_pos, n_pos), np.maximum(m_pos, n_pos)
+    ab_len, mn_len = ab_max - ab_min, mn_max - mn_min
+
+    pole = (ab_len < tol) & (mn_len < tol)
+    # the potential dipole lies inside the current dipole
+    inner = (mn_min > ab_min - tol) & (mn_max < ab_max + tol) & (ab_len > tol) & (mn_len > tol)
+    symmetric = np.abs((mn_min - ab_min) - (ab_max - mn_max)) < tol
+    wenner_a = inner & symmetric & (np.abs(ab_len - 3 * mn_len) < tol)
+    schlumberger = inner & symmetric & ~wenner_a
+    # the dipoles are separated
+    outer = (ab_len > tol) & (mn_len > tol) & ((mn_min > ab_max - tol) | (mn_max < ab_min + tol))
+    gap = np.maximum(mn_min - ab_max, ab_min - mn_max)
+    wenner_b = outer & (np.abs(ab_len - mn_len) < tol) & (np.abs(gap - ab_len) < tol)
+    dipole = outer & ~wenner_b
+
+    return np.select([pole, wenner_a, schlumberger, wenner_b, dipole],
+                     ['pp', 'wa', 'slm', 'wb', 'dd'], default='other')
+
+
+def depth_of_investigation(a_pos, b_pos, m_pos, n_pos):
+    """Return the median depth of investigation of each measurement.
+
+    The depth is the total length of the array (distance between the outermost electrodes)
+    multiplied by the factor of its electrode configuration (DOI_FACTORS). For the pole-pole
+    array, the length is the distance between A and M.
+    """
+    a_pos, b_pos, m_pos, n_pos = (np.asarray(pos, dtype=float)
+                                  for pos in (a_pos, b_pos, m_pos, n_pos))
+    stacked = np.vstack((a_pos, b_pos, m_pos, n_pos))
+    length = stacked.max(axis=0) - stacked.min(axis=0)
+    arrays = classify_arrays(a_pos, b_pos, m_pos, n_pos)
+
+    factor = np.full(len(length), DOI_FACTORS['other'])
+    for name in ['wa', 'wb', 'slm', 'pp']:
+        factor[arrays == name] = DOI_FACTORS[name]
+
+    # dipole separation n of the dipole-dipole array, in dipole lengths
+    dipole = arrays == 'dd'
+    dipole_len = np.maximum(np.abs(a_pos - b_pos), np.abs(m_pos - n_pos))[dipole]
+    gap = length[dipole] - np.abs(a_pos - b_pos)[dipole] - np.abs(m_pos - n_pos)[dipole]
+    factor[dipole] = np.interp(gap / dipole_len, *DD_DOI_FACTORS)
+
+    return factor * length
@@ -0,0 +1,180 @@
+"""The synthetic_stg module writes synthetic supersting files of any size for scale testing.
+
+The files follow the SuperSting R8 (.stg) format read by the read_res_data module: three header
+lines (the second one ending with the number of records), then one comma separated record per
+reading with the resistance, error, current, apparent resistivity, the xyz positions of the
+A, B, M, N electrodes and the command fields. The IP records carry their block (label, delay,
+window length, six windows and integrated chargeability) after the electrode positions, at the
+columns read by standardized_bert.
+
+The readings are Wenner Alpha and Dipole-Dipole configurations on a line of electrodes. When
+more records than configurations are requested, the configurations are repeated (stacked
+readings). The records are formatted by chunks, so files of millions of records (several GB)
+are written with a bounded memory.
+
+Dependence: numpy (pygimli to simulate the apparent resistivity with a RootSimulator)
+
+Example
+-------
+    write_stg('large.stg', n_electrodes=500, n_records=2_000_000, ip=True)
+"""
+import numpy as np
+
+HEADER = ("Advanced Geosciences, Inc. SuperSting R8-IP Resistivity meter. S/N: SS0604059 "
+          "Type: 3D\n"
+          "Firmware version: 01.23.44E Survey period: {date} Records: {records}\n"
+          "Unit: meter\n")
+
+# one record, the fields 9 to 20 are the xyz positions of A, B, M, N
+RECORD = ("{:4d},USER   ,{},{},{: .5E},{:4d},{:3d},{: .5E},{:<9s},{: .5E}, 0.00000E+00, "
+          "0.00000E+00,{: .5E}, 0.00000E+00, 0.00000E+00,{: .5E}, 0.00000E+00, 0.00000E+00,"
+          "{: .5E}, 0.00000E+00, 0.00000E+00,{}Cmd={:d},HV={:d},Cyk=1,MTime=0.8,Gain={:d},"
+          "Ch=1\n")
+IP_BLOCK = ("IP: ,{: .5E},{: .5E},{: .5E},{: .5E},{: .5E},{: .5E},{: .5E},{: .5E},{: .5E},")
+
+# delay and length of the six IP windows (s)
+IP_DELAY, IP_WINDOW = 0.26, 0.1
+
+
+def configurations(n_electrodes, arrays=('wa', 'dd'), max_n=6, max_dipole=3):
+    """Return the A, B, M, N electrode numbers (from 0) of all the readings of the line.
+
+    Parameters
+    ----------
+    n_electrodes: the number of electrodes of the line.
+    arrays: the electrode configurations, 'wa' (Wenner Alpha) and/or 'dd' (Dipole-Dipole).
+    max_n: the maximum dipole separation of the Dipole-Dipole readings.
+    max_dipole: the maximum dipole length (in electrode spacings) of the Dipole-Dipole readings.
+    """
+    for array in arrays:
+        if array not in ['wa', 'dd']:
+            raise ValueError(f"{array} is not a valid array. Use 'wa' or 'dd'")
+    if n_electrodes < 4:
+        raise ValueError("At least four electrodes are needed")
+
+    abmn = []
+    first = np.arange(n_electrodes)
+    if 'wa' in arrays:
+        # A M N B, with the electrode spacing a
+        for spacing in range(1, (n_electrodes - 1) // 3 + 1):
+            elec_a = first[:n_electrodes - 3 * spacing]
+            abmn.append(np.vstack((elec_a, elec_a + 3 * spacing, elec_a + spacing,
+                                   elec_a + 2 * spacing)))
+    if 'dd' in arrays:
+        # B A M N, as recorded by the supersting: B = A - a, M = A + n*a, N = M + a
+        for dipole in range(1, max_dipole + 1):
+            for sep in range(1, max_n + 1):
+                # the short lines have no room for the long arrays (a negative stop would wrap)
+                stop = n_electrodes - (sep + 1) * dipole
+                if stop <= dipole:
+                    continue
+                elec_a = first[dipole:stop]
+                abmn.append(np.vstack((elec_a, elec_a - dipole, elec_a + sep * dipole,
+                                       elec_a + (sep + 1) * dipole)))
+    return tuple(np.hstack(abmn))
+
+
+def geometric_factor(a_pos, b_pos, m_pos, n_pos):
+    """Return the geometric factor of the readings of a surface line."""
+    def inv_dist(pos1, pos2):
+        return 1 / np.abs(pos1 - pos2)
+    return 2 * np.pi / (inv_dist(a_pos, m_pos) - inv_dist(b_pos, m_pos)
+                        - inv_dist(a_pos, n_pos) + inv_dist(b_pos, n_pos))
+
+
+def simulated_rhoa(simulator, rhomap, positions, abmn):
+    """Return the apparent resistivity of the readings simulated with a RootSimulator.
+
+    The simulator must have a mesh (create_mesh) covering the positions of the electrodes.
+    Only the distinct configurations should be given, the forward model is costly.
+    """
+    # pygimli is only needed for this option of the generator
+    import pygimli as pg
+    from pygimli.physics import ert
+
+    scheme = pg.DataContainerERT()
+    for pos in positions:
+        scheme.createSensor([pos, 0.0])
+    scheme.resize(len(abmn[0]))
+    for tok, elec in zip(['a', 'b', 'm', 'n'], abmn):
+        scheme.set(tok, elec)
+    scheme.set('k', geometric_factor(*(positions[elec] for elec in abmn)))
+    # the data container is kept, its arrays are freed with it
+    data = ert.simulate(simulator.mesh, scheme=scheme, res=rhomap, noiseLevel=0)
+    return np.array(data['rhoa'])
+
+
+def write_stg(file, n_electrodes=84, n_records=None, spacing=1.5, start=0.0, arrays=('wa', 'dd'),
+              ip=False, noise=0.02, simulator=None, rhomap=None, name='SYNTH', date='20221118',
+              seed=1337, chunk_size=100000):
+    """Write a synthetic supersting file and return the number of records.
+
+    Parameters
+    ----------
+    file: the name of the supersting file (*.stg).
+    n_electrodes: the number of electrodes of the line.
+    n_records: the number of records. Default is the number of configurations of the line,
+               more records repeat the configurations.
+    spacing: the electrode spacing (m).
+    start: the position of the first electrode (m).
+    arrays: the electrode configurations, see configurations.
+    ip: boolean. To write the IP windows and the integrated chargeability.
+    noise: the relative noise added to the apparent resistivity.
+    simulator: RootSimulator with a mesh (create_mesh). If given with rhomap, the apparent
+               resistivity is simulated with its forward model instead of a layered model.
+    rhomap: the resistivity of the regions of the simulator, see RootSimulator.plot_rhomap.
+    name: the name of the survey written in each record (at most 9 characters).
+    date: the survey date (YYYYMMDD).
+    seed: the seed of the random noise.
+    chunk_size: the number of records formatted at once.
+    """
+    if file[-4:] != '.stg':
+        raise ValueError(f"{file} is not a supersting file name. Use the .stg extension")
+
+    abmn = configurations(n_electrodes, arrays)
+    n_config = len(abmn[0])
+    n_records = n_config if n_records is None else n_records
+    positions = start + spacing * np.arange(n_electrodes)
+
+    if simulator is not None and rhomap is not None:
+        config_rhoa = simulated_rhoa(simulator, rhomap, positions, abmn)
+    else:
+        # a two layer-like response: the resistivity decreases with the array length
+        stacked = np.vstack([positions[elec] for elec in abmn])
+        length = stacked.max(axis=0) - stacked.min(axis=0)
+        config_rhoa = 50 + 100 / (1 + (length / (10 * spacing)) ** 2)
+
+    rng = np.random.default_rng(seed)
+    with open(file, 'w', encoding='utf-8', newline='\r\n') as files:
+        files.write(HEADER.format(date=date, records=n_records))
+        for first in range(0, n_records, chunk_size):
+            index = np.arange(first, min(first + chunk_size, n_records))
+            config = index % n_config
+            elec_pos = [positions[elec[config]] for elec in abmn]
+            rhoa = config_rhoa[config] * (1 + noise * rng.standard_normal(len(index)))
+            resistance = rhoa / geometric_factor(*elec_pos)
+            current = rng.integers(150, 450, len(index))
+            # the records are taken every 7 seconds from 09:00:00
+            seconds = (9 * 3600 + 7 * index) % 86400
+            times = [f'{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d}'
+                     for sec in seconds.tolist()]
+
+            if ip:
+                # exponential decays, with the windows and the integrated chargeability (s)
+                charge = rng.uniform(5, 30, len(index)) * 1e-3
+                tau = rng.uniform(0.5, 2.0, len(index))
+                gates = IP_DELAY + IP_WINDOW * (np.arange(6) + 0.5)
+                windows = charge[:, None] * np.exp(-gates[None, :] / tau[:, None])
+                total = windows.sum(axis=1) * IP_WINDOW
+                ip_blocks = [IP_BLOCK.format(IP_DELAY, IP_WINDOW, *win, tot)
+                             for win, tot in zip(windows.tolist(), total.tolist())]
+            else:
+                ip_blocks = [''] * len(index)
+
+            files.write(''.join([
+                RECORD.format(ind + 1, date, tim, res, 0, cur, rho, name, pos_a, pos_b, pos_m,
+                              pos_n, ipb, ind % n_config + 1, 400, 10)
+                for ind, tim, res, cur, rho, pos_a, pos_b, pos_m, pos_n, ipb in zip(
+                    index.tolist(), times, resistance.tolist(), current.tolist(),
+                    rhoa.tolist(), *(pos.tolist() for pos in elec_pos), ip_blocks)]))
+    return n_records
@@ -0,0 +1,70 @@
+import os
+import sys
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import data_qc as dqc
+import pytest
+import numpy as np
+
+
+def test_group_readings():
+    # ABMN, its reciprocal MNAB, the same configuration with swapped electrodes and another one
+    a_ind, b_ind, m_ind, n_ind = [0, 2, 1, 0], [1, 3, 0, 1], [2, 0, 2, 3], [3, 1, 3, 4]
+    groups = dqc.group_readings(a_ind, b_ind, m_ind, n_ind)
+    assert groups[0] == groups[1] == groups[2]
+    assert groups[3] != groups[0]
+
+
+def test_reciprocal_error():
+    mean, spread, counts = dqc.reciprocal_error([90., 110., 50.], np.array([0, 0, 1]))
+    assert np.allclose(mean, [100., 50.])
+    # the sample standard deviation of 90 and 110 is 10 * sqrt(2)
+    assert np.allclose(spread, [0.1 * np.sqrt(2), 0.])
+    assert list(counts) == [2, 1]
+
+
+def test_fit_error_model():
+    # the absolute spread is 1 + 5% of the value
+    mean = np.logspace(0, 3, 200)
+    spread = (1 + 0.05 * mean) / mean
+    absolute, relative = dqc.fit_error_model(mean, spread)
+    assert absolute == pytest.approx(1, rel=0.05)
+    assert relative == pytest.approx(0.05, rel=0.05)
+
+
+def test_quality_control():
+    import pygimli as pg
+
+    # dipole-dipole readings, each with its reciprocal and a repetition, and 2% noise
+    rng = np.random.default_rng(1337)
+    configs = np.array([(a, a + 1, a + 1 + sep, a + 2 + sep)
+                        for sep in range(1, 7) for a in range(40 - 2 - sep)])
+    elec_a, elec_b, elec_m, elec_n = configs.T
+    abmn = [np.concatenate(elec) for elec in ((elec_a, elec_m, elec_a), (elec_b, elec_n, elec_b),
+                                              (elec_m, elec_a, elec_m), (elec_n, elec_b, elec_n))]
+    true = np.tile(np.logspace(1, 3, len(configs)), 3)
+    rhoa = true * (1 + 0.02 * rng.normal(size=len(true)))
+    # outliers in three groups, and an invalid reading
+    rhoa[[0, 5, 10]] *= 2
+    rhoa[20] = -1
+
+    data = pg.DataContainerERT()
+    for pos in range(40):
+        data.createSensor([float(pos), 0.0])
+    data.resize(len(rhoa))
+    for token, elec in zip(['a', 'b', 'm', 'n'], abmn):
+        data.set(token, elec)
+    data.set('rhoa', rhoa)
+    data.markValid(data['rhoa'] > 0)  # as standardized_bert
+
+    report = dqc.quality_control(data, max_error=0.1)
+    assert report['invalid'] == 1
+    assert report['repeated_groups'] == len(configs)
+    assert report['outlier_groups'] == 3 and report['outliers'] == 9
+    assert report['remaining'] == data.size() == len(rhoa) - 10
+    assert report['relative_error'] == pytest.approx(0.02, rel=0.25)
+
+    decimated = dqc.quality_control(data, decimate=True)
+    # one reading per group, the three outlier groups were removed
+    assert decimated['remaining'] == data.size() == len(configs) - 3
@@ -0,0 +1,44 @@
+import os
+import sys
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import instrumentation as ins
+import pytest
+
+
+def test_disabled_span():
+    # A disabled instrumentation must not emit any event.
+    ins.disable()
+    with ins.span('stage') as stage:
+        stage.set(cells=10)
+    assert not ins.is_enabled()
+
+
+def test_nested_spans():
+    events = []
+    ins.enable(callback=events.append)
+    try:
+        with ins.span('outer'):
+            with ins.span('inner', cells=10):
+                ins.record('iteration', iteration=1, chi2=1.5)
+    finally:
+        ins.disable()
+
+    assert [event['name'] for event in events] == ['iteration', 'inner', 'outer']
+    assert events[0]['parent'] == 'inner'
+    assert events[1]['parent'] == 'outer' and events[1]['cells'] == 10
+    assert events[2]['wall'] >= events[1]['wall']
+
+
+def test_failed_span():
+    events = []
+    ins.enable(callback=events.append)
+    try:
+        with pytest.raises(ValueError):
+            with ins.span('stage'):
+                raise ValueError('failed stage')
+    finally:
+        ins.disable()
+
+    assert events[0]['failed']
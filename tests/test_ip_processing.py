@@ -0,0 +1,47 @@
+import os
+import sys
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import ip_processing as ipp
+import numpy as np
+
+
+def test_fit_decays():
+    gates = ipp.window_gates()
+    m0, tau = np.array([0.02, 0.01, 0.01, 0.03]), np.array([1.0, 0.5, 0.5, 2.0])
+    windows = m0[:, None] * np.exp(-gates[None, :] / tau[:, None])
+    windows[2] = windows[2][::-1]  # rising decay
+    windows[3, 1] = -1  # negative window
+    fit_m0, fit_tau, misfit = ipp.fit_decays(windows, gates)
+    assert np.allclose(fit_m0[:2], m0[:2]) and np.allclose(fit_tau[:2], tau[:2])
+    assert np.allclose(misfit[:2], 0, atol=1e-12)
+    assert fit_tau[2] < 0 and np.isnan(misfit[3])
+
+
+def test_integral_chargeability():
+    # the integral of the decay equals the sum of many small windows
+    times = np.linspace(0.26, 0.86, 100001)
+    step = times[1] - times[0]
+    riemann = np.sum(0.02 * np.exp(-(times[:-1] + step / 2) / 0.8)) * step
+    assert np.isclose(ipp.integral_chargeability(0.02, 0.8, 0.26, 0.86), riemann)
+
+
+def test_invert_chargeability():
+    rng = np.random.default_rng(0)
+    n_cells = 30
+    true = np.exp(-((np.arange(n_cells) - 15) / 4) ** 2)
+    sens = rng.uniform(0, 1, (120, n_cells)) / n_cells
+    charge = sens @ true
+    # first-order smoothness constraints between neighbouring cells
+    rows = np.repeat(np.arange(n_cells - 1), 2)
+    cols = np.column_stack((np.arange(n_cells - 1), np.arange(1, n_cells))).ravel()
+    vals = np.tile([1.0, -1.0], n_cells - 1)
+    valid = np.ones(len(charge), dtype=bool)
+    valid[:10] = False
+    charge[:10] = 100  # rejected decays are not inverted
+    model, response = ipp.invert_chargeability(sens, charge, 0.01 * np.abs(charge) + 1e-4,
+                                               (rows, cols, vals), lam=1, valid=valid)
+    assert np.all(model >= 0)
+    assert np.abs(model - true).max() < 0.05
+    assert np.allclose(response[valid], charge[valid], rtol=0.05)
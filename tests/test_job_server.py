@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+import threading
+import time
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import job_server as js
+import pytest
+
+STG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data.stg')
+
+
+def test_submit_deduplicates(tmp_path):
+    # the server is not started, the jobs stay queued
+    jobs = js.JobServer(str(tmp_path), workers=1)
+    first = jobs.submit({'type': 'inversion', 'files': [STG_FILE], 'params': {'lam': 20}})
+    again = jobs.submit({'type': 'inversion', 'files': STG_FILE, 'params': {'lam': 20},
+                         'priority': 3})
+    other = jobs.submit({'type': 'inversion', 'files': [STG_FILE], 'params': {'lam': 10},
+                         'priority': 3})
+    assert again['duplicate'] and again['job_id'] == first['job_id']
+    assert other['job_id'] != first['job_id']
+    # the job of larger priority runs first
+    assert jobs.status(other['job_id'])['queue_position'] == 0
+    assert jobs.status(first['job_id'])['queue_position'] == 1
+
+    assert jobs.cancel(first['job_id'])['status'] == 'cancelled'
+    assert jobs.status(other['job_id'])['queue_position'] == 0
+    # a cancelled job is submitted again
+    assert jobs.submit({'type': 'inversion', 'files': [STG_FILE],
+                        'params': {'lam': 20}})['job_id'] != first['job_id']
+
+
+def test_submit_cached(tmp_path):
+    jobs = js.JobServer(str(tmp_path), workers=1)
+    key = js.job_key('ingest', [STG_FILE], {})
+    with open(os.path.join(str(tmp_path), 'cache', f'{key}.json'), 'w') as files:
+        json.dump({'data': 2448}, files)
+    job = jobs.submit({'type': 'ingest', 'files': [STG_FILE]})
+    assert job['status'] == 'done' and job['cached'] and job['result'] == {'data': 2448}
+    events, finished = jobs.wait_events(job['job_id'])
+    assert finished and events[-1]['event'] == 'done'
+
+
+def test_submit_errors(tmp_path):
+    jobs = js.JobServer(str(tmp_path), workers=1)
+    with pytest.raises(ValueError):
+        jobs.submit({'type': 'plot', 'files': [STG_FILE]})
+    with pytest.raises(ValueError):
+        jobs.submit({'type': 'ingest', 'files': ['missing.stg']})
+    with pytest.raises(ValueError):
+        jobs.submit({'type': 'inversion'})
+    with pytest.raises(ValueError):
+        jobs.cancel('unknown')
+    with pytest.raises(ValueError):
+        js.JobServer(str(tmp_path), workers=0)
+
+
+def test_run_job(tmp_path):
+    jobs = js.JobServer(str(tmp_path), workers=1)
+    jobs.start()
+    try:
+        job = jobs.submit({'type': 'ingest', 'files': [STG_FILE]})
+        events, finished, start = [], False, time.time()
+        while not finished and time.time() - start < 300:
+            new, finished = jobs.wait_events(job['job_id'], len(events))
+            events += new
+        job = jobs.status(job['job_id'])
+    finally:
+        jobs.stop()
+    assert job['status'] == 'done', job['error']
+    assert events[0]['event'] == 'started' and events[-1]['event'] == 'done'
+    assert job['result']['data'] > 0 and os.path.isfile(job['result']['data_file'])
+
+
+def test_client_absolute_files(tmp_path, monkeypatch):
+    # the server is not started, the job stays queued
+    jobs = js.JobServer(str(tmp_path / 'jobs'), workers=1)
+    httpd = js.make_server(jobs, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        monkeypatch.chdir(os.path.dirname(STG_FILE))
+        url = f'http://127.0.0.1:{httpd.server_address[1]}'
+        job = js.submit(url, {'type': 'ingest', 'files': [os.path.basename(STG_FILE)]})
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert job['files'] == [STG_FILE]
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import lambda_selection as ls
+import pytest
+import numpy as np
+
+
+def test_lambda_ladder():
+    lambdas = ls.lambda_ladder(1000, 1, 4)
+    assert np.allclose(lambdas, [1000, 100, 10, 1])
+
+
+def test_lcurve_corner():
+    # an L-shaped curve: the corner is the third point
+    phi_d = np.array([1000., 100., 10., 9., 8.])
+    phi_m = np.array([1., 1.1, 1.2, 100., 1000.])
+    assert ls.lcurve_corner(phi_d, phi_m) == 2
+
+
+def test_discrepancy_index():
+    # the largest lambda reaching chi² = 1 is chosen
+    assert ls.discrepancy_index([100, 10, 1], [5., 0.9, 0.5]) == 1
+    # none reaches the target, the best fit is chosen
+    assert ls.discrepancy_index([100, 10, 1], [5., 3., 2.]) == 2
+
+
+def test_criterion():
+    with pytest.raises(ValueError) as excinfo:
+        ls.select_lambda(None, None, criterion='gcv')
+    assert "not a valid criterion" in str(excinfo.value)
+
+
+def test_inverse_simulation_auto(tmp_path):
+    from root_simulator import RootSimulator, RootSimulator2
+    import synthetic_stg as sstg
+
+    # a 24-electrode survey simulated with 2% noise
+    simulator = RootSimulator()
+    simulator.create_geom([50, -50], -50, [-1, -20], [(-10, -1), (17, -8), (5, -1)])
+    simulator.create_mesh('dd', start=-17.25, end=17.25, num=24)
+    file = str(tmp_path / 'survey.stg')
+    sstg.write_stg(file, n_electrodes=24, spacing=1.5, start=-17.25, simulator=simulator,
+                   rhomap=[[1, 100], [2, 75], [3, 50], [4, 150]])
+    survey = RootSimulator2(file)
+    survey.generate_mesh()
+
+    start = time.perf_counter()
+    survey.inverse_simulation(lam=20)
+    single = time.perf_counter() - start
+    start = time.perf_counter()
+    survey.inverse_simulation(lam='auto', criterion='discrepancy', lambda_workers=1)
+    selection = time.perf_counter() - start
+
+    curve = survey.lambda_curve
+    # the largest lambda fitting the data
+    assert curve['chi2'][curve['index']] <= 1 < curve['chi2'][curve['index'] - 1]
+    # one cold inversion and one iteration per lambda, the chosen model is not inverted again
+    assert selection < 4 * single
+
+    # the chains of two workers are merged in the order of the ladder
+    survey.inverse_simulation(lam='auto', lambda_workers=2)
+    assert np.all(np.diff(survey.lambda_curve['lambdas']) < 0)
+    assert np.allclose(survey.lambda_curve['lambdas'], curve['lambdas'])
@@ -0,0 +1,30 @@
+import os
+import sys
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import pseudosection as ps
+import pytest
+import numpy as np
+
+
+def test_bin_median():
+    # two bins along x, the median of each bin is its middle value
+    x_pos = np.array([0., 0.1, 0.2, 1.0, 0.9])
+    depth = np.zeros(5)
+    values = np.array([10., 30., 20., 5., 7.])
+    grid, x_edges, _ = ps.bin_pseudosection(x_pos, depth, values, bins=(2, 1))
+    assert np.allclose(grid, [[20., 6.]])
+    assert np.allclose(x_edges, [0., 0.5, 1.])
+
+
+def test_empty_bins():
+    grid, _, _ = ps.bin_pseudosection([0., 1.], [0., 1.], [1., 2.], bins=2, agg='mean')
+    assert np.isnan(grid[0, 1]) and np.isnan(grid[1, 0])
+    assert grid[0, 0] == 1. and grid[1, 1] == 2.
+
+
+def test_aggregation():
+    with pytest.raises(ValueError) as excinfo:
+        ps.bin_pseudosection([0.], [0.], [1.], agg='max')
+    assert "not a valid aggregation" in str(excinfo.value)
@@ -1,7 +1,8 @@
+import os
 import sys
 
 # Get the location of the module
-sys.path.append('/home/johnsalako/Desktop/cmse802/root_variability_simulator/root_simulator')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
 import read_res_data
 import pytest
 import numpy as np
@@ -30,3 +31,38 @@ def test_missing_file_s4b():
         read_res_data.standardized_bert("super_data.stg")
 
     assert "does not exist" in str(excinfo.value)
+
+
+def test_merge_surveys():
+    # Test if the function raises the exception if no file is given.
+    with pytest.raises(ValueError) as excinfo:
+        read_res_data.merge_surveys([])
+
+    assert "At least one supersting file" in str(excinfo.value)
+
+
+def test_merge_offsets():
+    with pytest.raises(ValueError) as info:
+        read_res_data.merge_surveys([test_file, test_file], offsets=[0])
+
+    assert "one value for each file" in str(info.value)
+
+
+def test_merge_overlapping_surveys(tmp_path):
+    # two lines of 24 electrodes (1.5 m spacing), the second starts 18 m further (12 shared)
+    import synthetic_stg
+
+    first, second = str(tmp_path / 'line1.stg'), str(tmp_path / 'line2.stg')
+    synthetic_stg.write_stg(first, n_electrodes=24)
+    synthetic_stg.write_stg(second, n_electrodes=24, start=18.0)
+    abmn = np.array(synthetic_stg.configurations(24)).T * 1.5
+    expected = {tuple(row) for row in abmn} | {tuple(row + 18) for row in abmn}
+
+    for merged in [read_res_data.merge_surveys([first, second]),
+                   read_res_data.merge_surveys([first, first], offsets=[0, 18])]:
+        assert merged.sensorCount() == 36
+        assert merged.size() == len(expected)
+        sensors = np.array(merged.sensorPositions())[:, 0]
+        merged_abmn = {tuple(sensors[[int(merged[tok][i]) for tok in ['a', 'b', 'm', 'n']]])
+                       for i in range(merged.size())}
+        assert merged_abmn == expected
@@ -0,0 +1,61 @@
+import os
+import sys
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import results_store as rs
+import pytest
+import numpy as np
+
+
+def test_missing_run(tmp_path):
+    # Test if the store raises the exception if the run does not exist.
+    store = rs.ResultsStore(str(tmp_path))
+    with pytest.raises(ValueError) as excinfo:
+        store.load('20221118-000000-000000')
+    assert "is not a run" in str(excinfo.value)
+
+
+def test_empty_store(tmp_path):
+    # The incomplete runs (without meta.json) are ignored.
+    os.makedirs(tmp_path / 'incomplete_run')
+    assert rs.ResultsStore(str(tmp_path)).query() == []
+
+
+def test_file_digest():
+    assert len(rs.file_digest(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                         'test_data.stg'))) == 64
+
+
+def test_round_trip(tmp_path):
+    import pygimli as pg
+    from root_simulator import RootSimulator2
+
+    stg_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data.stg')
+    mesh = pg.createGrid(x=np.linspace(0, 4, 5), y=np.linspace(-2, 0, 3))
+    model = np.linspace(10, 80, mesh.cellCount())
+    store = rs.ResultsStore(str(tmp_path))
+    run_id = store.save(mesh, model, chi2=1.2, settings={'lam': 20}, data_files=stg_file,
+                        name='grid', response=np.arange(3.0), coverage=None)
+
+    # the queries only read the meta data
+    assert [meta['run_id'] for meta in store.query(lam=20)] == [run_id]
+    assert len(store.query(data_file='test_data.stg')) == 1
+    assert store.query(where=lambda meta: meta['chi2'] < 1) == []
+    meta = store.query(name='grid')[0]
+    assert meta['arrays'] == ['response', 'model'] and meta['cells'] == mesh.cellCount()
+    assert meta['provenance']['data_sha256'] == [rs.file_digest(stg_file)]
+
+    run = store.load(run_id)
+    assert isinstance(run.model, np.memmap) and np.allclose(run.model, model)
+    assert np.allclose(run.response, np.arange(3.0))
+    assert run.chi2 == 1.2 and run.settings == {'lam': 20}
+    assert run.mesh.cellCount() == mesh.cellCount()
+    with pytest.raises(AttributeError):
+        getattr(run, 'coverage')
+    # the stored run is plotted without the data nor an inversion
+    axis, _ = RootSimulator2(stg_file).plot_inverse(min_res=10, max_res=80, run=run)
+    assert axis is not None
+
+    store.delete(run_id)
+    assert store.query() == []
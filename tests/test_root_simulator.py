@@ -1,8 +1,10 @@
+import os
 import sys
 
 # Get the location of the module
-sys.path.append('/home/johnsalako/Desktop/cmse802/root_variability_simulator/root_simulator')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
 from root_simulator import RootSimulator, RootSimulator2
+import synthetic_stg as sstg
 import pytest
 import numpy as np
 
@@ -34,7 +36,36 @@ def test_create_mesh():
         root_simulator.create_mesh('kk')
     assert "not a valid scheme_name" in str(excinfo.value)
     
-    
+RHOMAP = [[1, 100], [2, 75], [3, 50], [4, 150]]
+
+
+def _triangle_geometry():
+    simulator = RootSimulator()
+    simulator.create_geom([50, -50], -50, [-1, -20], [(-10, -1), (17, -8), (5, -1)])
+    return simulator
+
+
+def test_create_adaptive_mesh():
+    simulator = _triangle_geometry()
+    simulator.create_adaptive_mesh('dd', rhomap=RHOMAP)
+    report = simulator.mesh_report
+    # fewer cells than the fine uniform mesh, at the same accuracy of rhoa
+    assert report['cells'] < report['uniform_cells']
+    assert report['max_rhoa_error'] <= max(report['uniform_max_rhoa_error'], 0.01)
+
+
+def test_refine_mesh():
+    simulator = _triangle_geometry()
+    simulator.create_mesh('dd', start=-20, end=20, num=11)
+    cells = simulator.mesh.cellCount()
+    # a zero tolerance always refines
+    simulator.refine_mesh(RHOMAP, tolerance=0, max_steps=1)
+    report = simulator.mesh_report
+    assert report['refinement_steps'] == 1
+    assert report['cells'] == simulator.mesh.cellCount() > cells
+    assert np.isfinite(report['max_rhoa_error'])
+
+
 # Unit Test for the RootSimulator2 class
 # Confirm the data format is in the right format
 missing_dat = RootSimulator2('invalid_data.stg')
@@ -51,3 +82,15 @@ def test_extract_electrode():
         data_format.generate_mesh()
     assert "not a supersting file" in str(info.value)
 
+
+def test_generate_mesh_small_survey(tmp_path):
+    # a small survey meshed with the default (data-driven) depth and cell size
+    file = str(tmp_path / 'small.stg')
+    sstg.write_stg(file, n_electrodes=24, spacing=1.5)
+    simulator = RootSimulator2(file)
+    simulator.generate_mesh()
+    para = np.array(simulator.mesh.cellMarkers()) == 2
+    assert 0 < para.sum() < simulator.mesh.cellCount()
+    depth = -np.array(simulator.mesh.cellCenters())[para, 1].min()
+    # the parameter domain is shallower than the array (24 electrodes, 34.5 m)
+    assert depth < 34.5
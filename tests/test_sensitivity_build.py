@@ -1,7 +1,8 @@
+import os
 import sys
 
 # Get the location of the module
-sys.path.append('/home/johnsalako/Desktop/cmse802/root_variability_simulator/root_simulator')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
 import sensitivity_build as sb
 import pytest
 import numpy as np
@@ -0,0 +1,82 @@
+import os
+import sys
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import surrogate as sg
+import pytest
+import numpy as np
+
+
+def test_polynomial_features():
+    poly = sg.polynomial_features([[2.0, 3.0]], degree=2)
+    assert np.allclose(poly, [[1, 2, 3, 4, 6, 9]])
+    assert sg.polynomial_features(np.ones((5, 4)), degree=1).shape == (5, 5)
+
+
+def test_reduced_basis_regression():
+    rng = np.random.default_rng(1)
+    basis = rng.normal(size=(3, 120))
+
+    def outputs(params):
+        return np.column_stack((params[:, 0] + 0.3 * params[:, 1] ** 2,
+                                params[:, 2] * params[:, 3], params[:, 1])) @ basis
+
+    params = rng.uniform(-1, 1, (80, 4))
+    model = sg.ReducedBasisRegression().fit(params, outputs(params))
+    queries = rng.uniform(-0.9, 0.9, (5, 4))
+    assert model.components == 3
+    assert np.allclose(model.predict(queries), outputs(queries), atol=1e-6)
+    assert np.all(model.error < 1e-6)
+    assert np.all(model.in_domain(queries))
+    assert not model.in_domain([[5.0, 0.0, 0.0, 0.0]])[0]
+    # the error grows with the leverage of the query
+    errors = model.error_at([[0.0, 0.0, 0.0, 0.0], [0.95, -0.95, 0.95, -0.95]])
+    assert errors.shape == (2, 120)
+    assert np.all(errors[1] > errors[0])
+
+    restored = sg.ReducedBasisRegression().set_state(model.state())
+    assert np.allclose(restored.predict(queries), model.predict(queries))
+    with pytest.raises(ValueError):
+        sg.ReducedBasisRegression().fit(params[:10], outputs(params[:10]))
+
+
+def test_self_intersecting():
+    square = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    bowtie = [(0, 0), (1, 1), (1, 0), (0, 1)]
+    assert list(sg.self_intersecting([square, bowtie])) == [False, True]
+
+
+def test_perturb_feature():
+    feature = [(-25, -2), (-10, -15), (10, -15), (25, -2), (0, -8)]
+    features = sg.perturb_feature(feature, [50, -50], [-1, -20], num=200, scale=5.0)
+    nodes = np.array(features)
+    assert nodes.shape == (200, 5, 2)
+    assert np.all((nodes[:, :, 1] <= -1) & (nodes[:, :, 1] >= -20))
+    # 20 m away from the lateral boundaries, as required by create_geom
+    assert np.all((nodes[:, :, 0] <= 30) & (nodes[:, :, 0] >= -30))
+    assert not sg.self_intersecting(nodes).any()
+    with pytest.raises(ValueError):
+        sg.perturb_feature(feature, [20, -20], [-1, -20])
+
+
+class _LinearSurrogate(sg.RootSurrogate):
+    """A surrogate whose FE runs are replaced by a closed form, failing for the deep features."""
+
+    def simulate(self, feature, rhomap, section=False, lam=20):
+        nodes = np.asarray(feature)
+        if nodes[:, 1].min() < -15:
+            raise RuntimeError("mesh generation failed")
+        return 10 ** (np.linspace(0, 1, 30) * nodes[:, 1].mean() / 20 + 2), None
+
+
+def test_fit_skips_failed_runs():
+    features = sg.perturb_feature([(-10, -1), (17, -8), (5, -1)], [50, -50], [-1, -20], num=60,
+                                  scale=4.0)
+    rhomaps = [[[1, 100], [2, 75], [3, 50], [4, 200]]] * len(features)
+    surrogate = _LinearSurrogate([50, -50], -50, [-1, -20], degree=1)
+    report = surrogate.fit(features, rhomaps)
+    deep = [ind for ind, feature in enumerate(features) if min(y for _, y in feature) < -15]
+    assert deep
+    assert [run['index'] for run in report['failed_runs']] == deep
+    assert report['runs'] == len(features) - len(deep)
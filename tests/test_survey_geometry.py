@@ -0,0 +1,32 @@
+import os
+import sys
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import survey_geometry as sgeo
+import pytest
+import numpy as np
+
+# A, B, M, N positions of a Wenner Alpha, Wenner Beta, Dipole-Dipole (n=2) and Schlumberger
+a_pos = np.array([0., 3., 120., 0.])
+b_pos = np.array([9., 0., 118.5, 10.])
+m_pos = np.array([3., 6., 123., 4.])
+n_pos = np.array([6., 9., 124.5, 6.])
+
+
+def test_classify_arrays():
+    arrays = sgeo.classify_arrays(a_pos, b_pos, m_pos, n_pos)
+    assert list(arrays) == ['wa', 'wb', 'dd', 'slm']
+
+
+def test_depth_of_investigation():
+    depth = sgeo.depth_of_investigation(a_pos, b_pos, m_pos, n_pos)
+    assert np.allclose(depth, [0.173 * 9, 0.139 * 9, 0.174 * 6, 0.190 * 10])
+
+
+def test_electrode_spacing():
+    with pytest.raises(ValueError) as excinfo:
+        sgeo.electrode_spacing([1., 1.])
+    assert "At least two electrodes" in str(excinfo.value)
+
+    assert sgeo.electrode_spacing([0., 1.5, 3., 4.5, 9.]) == 1.5
@@ -0,0 +1,64 @@
+import os
+import sys
+
+# Get the location of the module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'root_simulator'))
+import synthetic_stg as sstg
+import pytest
+import numpy as np
+
+
+def test_configurations():
+    a_ind, b_ind, m_ind, n_ind = sstg.configurations(84, arrays=('wa',))
+    # Wenner Alpha: 84 - 3a readings for each spacing a
+    assert len(a_ind) == sum(84 - 3 * spacing for spacing in range(1, 28))
+    assert np.all(m_ind - a_ind == n_ind - m_ind)
+    assert np.all(b_ind - n_ind == m_ind - a_ind)
+    with pytest.raises(ValueError):
+        sstg.configurations(84, arrays=('pp',))
+    with pytest.raises(ValueError):
+        sstg.configurations(3)
+
+
+
+@pytest.mark.parametrize('n_electrodes', range(4, 21))
+def test_configurations_short_lines(n_electrodes, tmp_path):
+    abmn = np.vstack(sstg.configurations(n_electrodes))
+    assert abmn.shape[1] > 0
+    assert np.all((abmn >= 0) & (abmn < n_electrodes))
+    # the four electrodes of a reading are distinct
+    assert np.all(np.sort(abmn, axis=0)[1:] != np.sort(abmn, axis=0)[:-1])
+    assert sstg.write_stg(str(tmp_path / 'short.stg'), n_electrodes=n_electrodes) == abmn.shape[1]
+
+
+def test_write_stg(tmp_path):
+    file = str(tmp_path / 'synthetic.stg')
+    n_records = sstg.write_stg(file, n_electrodes=24, n_records=500, ip=True, chunk_size=128)
+    assert n_records == 500
+    with open(file, 'rb') as files:
+        lines = files.read().split(b'\r\n')
+    assert lines[1].endswith(b'Records: 500')
+
+    data = np.genfromtxt(file, delimiter=',', skip_header=3)
+    assert data.shape[0] == 500
+    assert np.all(data[:, 4] > 0) and np.all(data[:, 7] > 0)
+    # the IP windows decay and the integrated chargeability is after the six windows
+    assert np.all(np.diff(data[:, 24:30], axis=1) < 0)
+    assert np.allclose(data[:, 30], data[:, 24:30].sum(axis=1) * sstg.IP_WINDOW, rtol=1e-4)
+    with pytest.raises(ValueError):
+        sstg.write_stg(str(tmp_path / 'synthetic.txt'))
+
+
+def test_write_stg_simulated(tmp_path):
+    from root_simulator import RootSimulator
+
+    simulator = RootSimulator()
+    simulator.create_geom([50, -50], -50, [-1, -20], [(-10, -1), (17, -8), (5, -1)])
+    simulator.create_mesh('dd', start=-15, end=15, num=21)
+    file = str(tmp_path / 'simulated.stg')
+    n_records = sstg.write_stg(file, n_electrodes=21, spacing=1.5, start=-15, noise=0,
+                               simulator=simulator, rhomap=[[1, 100], [2, 75], [3, 50], [4, 150]])
+    data = np.genfromtxt(file, delimiter=',', skip_header=3)
+    assert data.shape[0] == n_records
+    # the apparent resistivity lies within the resistivity of the regions
+    assert np.all((data[:, 7] > 50) & (data[:, 7] < 150))